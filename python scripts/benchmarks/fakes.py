@@ -0,0 +1,162 @@
+import hashlib
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+
+# --- STAND-INS FOR MODELS AND FIRESTORE ---
+# Installed into sys.modules before a service's main.py is imported, so the
+# services run unchanged but without downloading models or reaching Google
+# Cloud. Outputs are deterministic, which keeps result fingerprints stable.
+
+STUB_MODEL_NAME = 'benchmark-stub'
+EMBEDDING_DIM = 384
+NEGATIVE_WORDS = ('bad', 'dirty', 'rude', 'cold', 'overpriced', 'closed', 'waited', 'awful')
+
+
+# --- MODELS ---
+class FakeSentenceTransformer:
+    """Hashed character-trigram embeddings; similar strings get similar vectors."""
+
+    def __init__(self, model_name=None, device=None):
+        self.model_name = model_name
+
+    def _embed(self, text):
+        vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+        padded = f"  {text.lower()}  "
+        for i in range(len(padded) - 2):
+            digest = hashlib.md5(padded[i:i + 3].encode()).digest()
+            vector[int.from_bytes(digest[:4], 'little') % EMBEDDING_DIM] += 1.0
+        return vector
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        embeddings = np.stack([self._embed(t) for t in texts]) if texts else np.zeros((0, EMBEDDING_DIM), np.float32)
+        if normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings[0] if single else embeddings
+
+
+def fake_pipeline(task, model=None, **kwargs):
+    """transformers.pipeline('sentiment-analysis') look-alike: NEGATIVE if a negative word appears."""
+    def classify(inputs, batch_size=32, **call_kwargs):
+        texts = [inputs] if isinstance(inputs, str) else list(inputs)
+        results = []
+        for text in texts:
+            hits = sum(word in text.lower() for word in NEGATIVE_WORDS)
+            if hits:
+                results.append({"label": 'NEGATIVE', "score": round(0.6 + min(hits, 4) * 0.1, 4)})
+            else:
+                results.append({"label": 'POSITIVE', "score": 0.95})
+        return results
+    return classify
+
+
+# --- FIRESTORE ---
+class _Snapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class _DocumentRef:
+    def __init__(self, client, collection, doc_id):
+        self._client = client
+        self.collection = collection
+        self.id = doc_id
+
+    def get(self):
+        return self._client.get_all([self])[0]
+
+    def set(self, data):
+        self._client._write(self.collection, self.id, data)
+
+
+class _CollectionRef:
+    def __init__(self, client, name):
+        self._client = client
+        self.name = name
+
+    def document(self, doc_id):
+        return _DocumentRef(self._client, self.name, doc_id)
+
+
+class _WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, ref, data):
+        self._writes.append((ref, data))
+
+    def commit(self):
+        self._client._round_trip()
+        for ref, data in self._writes:
+            self._client._write(ref.collection, ref.id, data)
+
+
+class InMemoryFirestore:
+    """
+    The slice of the Firestore client the services use: collection().document(),
+    get_all() and batch(). Every round trip sleeps `latency_ms` to stand in for
+    the network, so fetch/inference overlap shows up in the numbers.
+    """
+
+    def __init__(self, data=None, latency_ms=0.0):
+        self.data = {name: dict(docs) for name, docs in (data or {}).items()}
+        self.latency_ms = latency_ms
+        self.round_trips = 0
+        self._lock = threading.Lock()
+
+    def _round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def _write(self, collection, doc_id, data):
+        with self._lock:
+            self.data.setdefault(collection, {})[doc_id] = dict(data)
+
+    def collection(self, name):
+        return _CollectionRef(self, name)
+
+    def get_all(self, refs):
+        refs = list(refs)
+        self._round_trip()
+        return [_Snapshot(ref.id, self.data.get(ref.collection, {}).get(ref.id)) for ref in refs]
+
+    def batch(self):
+        return _WriteBatch(self)
+
+
+# --- INSTALL ---
+def _module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    return module
+
+
+def install_model_stubs():
+    """Replaces sentence_transformers and transformers with the fake models."""
+    _module('sentence_transformers', SentenceTransformer=FakeSentenceTransformer)
+    _module('transformers', pipeline=fake_pipeline)
+
+
+def install_firestore(client):
+    """firebase_admin whose firestore.client() returns `client`."""
+    credentials = _module('firebase_admin.credentials')
+    firestore = _module('firebase_admin.firestore', client=lambda app=None: client)
+    _module(
+        'firebase_admin', _apps={}, credentials=credentials, firestore=firestore,
+        initialize_app=lambda *args, **kwargs: None,
+    )
+    return client
@@ -0,0 +1,129 @@
+"""
+Concurrent load generator for a running service (gunicorn or functions-framework).
+
+    python load_test.py http://localhost:8080 --service nlp --concurrency 16 --duration 30
+    python load_test.py http://localhost:8080 --service sentiment --server-pid <gunicorn master pid>
+
+Keeps `concurrency` requests in flight for `duration` seconds and reports
+throughput and p50/p95/p99 latency. With --server-pid it also sums RSS and
+PSS over the master and its workers, which shows how much of the model memory
+the forked workers actually share (PSS splits shared pages between processes).
+Sentiment payloads reference place IDs that must exist in the Firestore the
+server talks to (e.g. the emulator seeded with scenarios.sentiment_fixture).
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from scenarios import nlp_payload, sentiment_fixture  # noqa: E402
+
+
+def build_payloads(service, size, variants):
+    """`variants` distinct payloads, so caches do not turn the test into pure cache hits."""
+    payloads = []
+    for i in range(variants):
+        scenario = {"name": f"load_{service}_{size}_{i}"}
+        if service == 'nlp':
+            payloads.append(nlp_payload({**scenario, "queries": size}, None))
+        else:
+            payloads.append(sentiment_fixture({**scenario, "places": size, "reviews": 10})[1])
+    return payloads
+
+
+def _memory_kb(pid):
+    """(rss, pss) in KiB from /proc/<pid>/smaps_rollup (Linux)."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:'):
+                values[parts[0][:-1]] = int(parts[1])
+    return values.get('Rss', 0), values.get('Pss', 0)
+
+
+def server_memory(master_pid):
+    pids = [master_pid]
+    with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+        pids += [int(p) for p in f.read().split()]
+    rss = pss = 0
+    for pid in pids:
+        r, p = _memory_kb(pid)
+        rss += r
+        pss += p
+    return {"processes": len(pids), "rss_mb": round(rss / 1024, 1), "pss_mb": round(pss / 1024, 1)}
+
+
+def run(url, payloads, concurrency, duration, timeout):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client(index):
+        i = index
+        while time.perf_counter() < stop_at:
+            body = json.dumps(payloads[i % len(payloads)]).encode()
+            i += concurrency
+            request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    response.read()
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+            except (urllib.error.URLError, OSError) as e:
+                with lock:
+                    errors.append(str(e))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies_ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "throughput_rps": round(len(latencies) / wall, 2),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 2),
+        "first_error": errors[0] if errors else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test for the inference services")
+    parser.add_argument('url')
+    parser.add_argument('--service', choices=('nlp', 'sentiment'), default='nlp')
+    parser.add_argument('--size', type=int, default=8, help="Queries (nlp) or places (sentiment) per request")
+    parser.add_argument('--variants', type=int, default=32)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--server-pid', type=int)
+    args = parser.parse_args()
+
+    payloads = build_payloads(args.service, args.size, args.variants)
+    for concurrency in args.concurrency:
+        result = run(args.url, payloads, concurrency, args.duration, args.timeout)
+        if args.server_pid:
+            result["server_memory"] = server_memory(args.server_pid)
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
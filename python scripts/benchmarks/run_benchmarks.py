@@ -0,0 +1,392 @@
+"""
+Offline benchmark and regression suite for the three Python services.
+
+Every scenario runs in a fresh interpreter: the service's main.py is imported
+with stub models and an in-memory Firestore (see fakes.py), wrapped in a Flask
+app and driven through its test client. path_finder serves a synthetic walk
+graph (or an OSM XML fixture) from an offline tile cache.
+
+    python run_benchmarks.py                      # run, compare with the baselines
+    python run_benchmarks.py --update-baseline    # record new baselines
+    python run_benchmarks.py --only route_wp10 sentiment_50x10
+
+Before the path_finder scenarios, 'astar' and 'ch' are checked against
+Dijkstra on a small grid; any distance mismatch fails the run.
+
+Two baselines:
+  fingerprints.json  what each scenario returns (stub models, synthetic grid).
+                     It does not depend on the machine and is committed; a
+                     scenario without a fingerprint fails.
+  baseline.json      p95 latency and peak RSS. Machine-specific: record it on
+                     the machine that runs the comparison (without one, only
+                     the fingerprints are checked).
+
+Fails (exit 1) when a scenario's response fingerprint differs from (or is
+missing in) fingerprints.json, when repeated requests disagree with each
+other, or when p95 latency / peak RSS regress past the tolerances.
+"""
+import argparse
+import glob
+import hashlib
+import importlib.util
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVICES_DIR = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from scenarios import (  # noqa: E402
+    ENGINE_CHECK_GRID_SIZE, ENGINE_CHECK_PAIRS, REGION, SCENARIOS, SEED, SERVICES,
+    nlp_payload, prepare_graph, route_payload, sentiment_fixture, synthetic_walk_graph,
+)
+
+DEFAULT_FINGERPRINTS = os.path.join(HERE, 'fingerprints.json')
+DEFAULT_BASELINE = os.path.join(HERE, 'baseline.json')
+# Regression thresholds, relative to the baseline; latency also gets an absolute
+# slack so sub-millisecond scenarios do not fail on timer noise
+LATENCY_TOLERANCE = 0.30
+LATENCY_SLACK_MS = 2.0
+RSS_TOLERANCE = 0.20
+# Response fields that legitimately change between runs
+VOLATILE_KEYS = {'timing', 'time_ms'}
+
+
+# --- RESULT FINGERPRINTS ---
+def _normalize(value):
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items() if k not in VOLATILE_KEYS}
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    if isinstance(value, float):
+        return round(value, 3)
+    return value
+
+
+def fingerprint(body):
+    return hashlib.sha256(json.dumps(_normalize(body), sort_keys=True).encode()).hexdigest()[:16]
+
+
+def response_body(response):
+    if response.mimetype == 'application/x-ndjson':
+        return [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line]
+    return response.get_json(silent=True)
+
+
+# --- WORKER (one scenario, fresh process) ---
+def peak_rss_mb():
+    """
+    This process's peak RSS. VmHWM starts over at exec; ru_maxrss (the fallback
+    off Linux) keeps the parent's peak, which the graph seeding inflates.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    # ru_maxrss is KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def load_service(service, work_dir, stub_models=True, firestore_latency_ms=0.0, firestore_data=None):
+    """Imports <service>/main.py with the stand-ins installed and returns (module, flask app)."""
+    import fakes
+
+    os.environ['ROUTE_GRAPH_CACHE_DIR'] = os.path.join(work_dir, 'graphs')
+    os.environ['ROUTE_GRAPH_OFFLINE'] = '1'
+    os.environ['NLP_INDEX_DIR'] = os.path.join(work_dir, 'nlp_index')
+    if stub_models:
+        fakes.install_model_stubs()
+        os.environ['NLP_MODEL_NAME'] = fakes.STUB_MODEL_NAME
+        os.environ['SENTIMENT_MODEL_NAME'] = fakes.STUB_MODEL_NAME
+    fakes.install_firestore(fakes.InMemoryFirestore(firestore_data, firestore_latency_ms))
+
+    service_dir = os.path.join(SERVICES_DIR, service)
+    sys.path.insert(0, service_dir)
+    spec = importlib.util.spec_from_file_location('main', os.path.join(service_dir, 'main.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['main'] = module
+    spec.loader.exec_module(module)
+
+    import flask
+    handler = getattr(module, SERVICES[service])
+    app = flask.Flask(f"bench_{service}")
+    app.add_url_rule('/', SERVICES[service], lambda: handler(flask.request), methods=['POST', 'OPTIONS'])
+    return module, app
+
+
+def run_scenario(scenario, work_dir, repeats, warmup, stub_models, firestore_latency_ms):
+    service = scenario['service']
+    firestore_data = None
+    if service == 'sentiment_analysis':
+        firestore_data, payload = sentiment_fixture(scenario)
+    elif service == 'natural_language_processing':
+        payload = nlp_payload(scenario, work_dir)
+    else:
+        payload = route_payload(scenario, work_dir)
+
+    started = time.perf_counter()
+    module, app = load_service(service, work_dir, stub_models, firestore_latency_ms, firestore_data)
+    startup_ms = (time.perf_counter() - started) * 1000
+    client = app.test_client()
+
+    def reset():
+        if scenario.get('cold'):
+            module.verdict_cache = type(module.verdict_cache)(module.MODEL_VERSION)
+
+    # Service logs would drown the report
+    devnull = open(os.devnull, 'w')
+    stdout, sys.stdout = sys.stdout, devnull
+    try:
+        latencies, fingerprints, statuses = [], set(), set()
+        for i in range(warmup + repeats):
+            reset()
+            t = time.perf_counter()
+            response = client.post('/', json=payload)
+            body = response_body(response)
+            elapsed = time.perf_counter() - t
+            statuses.add(response.status_code)
+            fingerprints.add(fingerprint(body))
+            if i == 0:
+                first_ms = elapsed * 1000
+                first_body = body
+            if i >= warmup:
+                latencies.append(elapsed)
+    finally:
+        sys.stdout = stdout
+        devnull.close()
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "name": scenario['name'],
+        "service": service,
+        "status": sorted(statuses),
+        "fingerprint": fingerprint(first_body),
+        "consistent": len(fingerprints) == 1,
+        "startup_ms": round(startup_ms, 2),
+        "first_ms": round(first_ms, 2),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+        "throughput_rps": round(len(latencies) / (latencies_ms.sum() / 1000), 2),
+        "peak_rss_mb": peak_rss_mb(),
+        "repeats": repeats,
+    }
+
+
+# --- COMPARISON ---
+def compare(result, expected_fingerprint, baseline, latency_tolerance, rss_tolerance):
+    """
+    List of failure messages for one scenario (empty when it passes). A missing
+    fingerprint fails; a missing latency/RSS baseline (None) skips those checks.
+    """
+    failures = []
+    if result['status'] != [200]:
+        failures.append(f"HTTP status {result['status']}")
+    if not result['consistent']:
+        failures.append("repeated requests returned different results")
+    if expected_fingerprint is None:
+        failures.append("no recorded fingerprint")
+    elif result['fingerprint'] != expected_fingerprint:
+        failures.append(f"results changed ({expected_fingerprint} -> {result['fingerprint']})")
+    if baseline is None:
+        return failures
+
+    p95_limit = baseline['p95_ms'] * (1 + latency_tolerance) + LATENCY_SLACK_MS
+    if result['p95_ms'] > p95_limit:
+        failures.append(f"p95 {result['p95_ms']}ms > {p95_limit:.2f}ms (baseline {baseline['p95_ms']}ms)")
+    rss_limit = baseline['peak_rss_mb'] * (1 + rss_tolerance)
+    if result['peak_rss_mb'] > rss_limit:
+        failures.append(f"peak RSS {result['peak_rss_mb']}MB > {rss_limit:.1f}MB (baseline {baseline['peak_rss_mb']}MB)")
+    return failures
+
+
+def print_table(results, failures):
+    columns = ('name', 'p50_ms', 'p95_ms', 'throughput_rps', 'peak_rss_mb', 'first_ms', 'fingerprint')
+    print(' '.join(f"{c:>16}" if c != 'name' else f"{c:<24}" for c in columns) + '  verdict')
+    for result in results:
+        cells = [f"{result['name']:<24}"] + [f"{result[c]!s:>16}" for c in columns[1:]]
+        verdict = 'FAIL: ' + '; '.join(failures[result['name']]) if failures[result['name']] else 'ok'
+        print(' '.join(cells) + '  ' + verdict)
+
+
+# --- ORCHESTRATION ---
+# Modules every listed service deploys its own identical copy of: (file, services)
+SHARED_MODULES = [
+    ('instrumentation.py', list(SERVICES)),
+    ('microbatch.py', ['natural_language_processing', 'sentiment_analysis']),
+    ('onnx_common.py', ['natural_language_processing', 'sentiment_analysis']),
+]
+
+
+def shared_module_drift():
+    """(file, service) pairs whose copy differs from the first service listed for it."""
+    def read(service, filename):
+        with open(os.path.join(SERVICES_DIR, service, filename), 'rb') as f:
+            return f.read()
+    drifted = []
+    for filename, services in SHARED_MODULES:
+        reference = read(services[0], filename)
+        drifted += [(filename, service) for service in services[1:] if read(service, filename) != reference]
+    return drifted
+
+
+def _use_path_finder():
+    path = os.path.join(SERVICES_DIR, 'path_finder')
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def is_prepared(work_dir, hierarchy):
+    if not os.path.exists(os.path.join(work_dir, 'route_points.json')):
+        return False
+    return not hierarchy or bool(glob.glob(os.path.join(work_dir, 'graphs', f"*_region_{REGION}_*", 'ch_rank.npy')))
+
+
+def prepare(work_dir, osm_fixture, hierarchy):
+    """Seeds the offline walk-graph cache once; every path_finder worker reads it."""
+    os.environ['ROUTE_GRAPH_CACHE_DIR'] = os.path.join(work_dir, 'graphs')
+    _use_path_finder()
+    return prepare_graph(work_dir, osm_fixture, hierarchy)
+
+
+def engine_mismatches():
+    """
+    {engine: [mismatching pairs]} from compare_with_dijkstra for 'astar' and
+    'ch' on a small synthetic grid: both must give Dijkstra's distances.
+    """
+    _use_path_finder()
+    from csr_graph import CSRGraph
+    from routing_engines import compare_with_dijkstra, prepare_hierarchy
+
+    graph = CSRGraph.from_networkx(synthetic_walk_graph(size=ENGINE_CHECK_GRID_SIZE))
+    prepare_hierarchy(graph)
+    rng = random.Random(SEED)
+    pairs = [(rng.randrange(graph.num_nodes), rng.randrange(graph.num_nodes)) for _ in range(ENGINE_CHECK_PAIRS)]
+    return {name: compare_with_dijkstra(graph, name, pairs) for name in ('astar', 'ch')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark and regression suite for the Python services")
+    parser.add_argument('--only', nargs='*', help="Scenario names (or prefixes) to run")
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--fingerprints', help=f"Expected results (default: {os.path.basename(DEFAULT_FINGERPRINTS)})")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Latency / RSS baseline of this machine")
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--latency-tolerance', type=float, default=LATENCY_TOLERANCE)
+    parser.add_argument('--rss-tolerance', type=float, default=RSS_TOLERANCE)
+    parser.add_argument('--firestore-latency-ms', type=float, default=2.0)
+    parser.add_argument('--real-models', action='store_true', help="Load the real models instead of the stubs")
+    parser.add_argument('--osm-fixture', help="OSM XML walk extract to use instead of the synthetic grid")
+    parser.add_argument('--work-dir', help="Reuse a work directory (graph cache, category index)")
+    parser.add_argument('--out', help="Also write the results as JSON here")
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.fingerprints is None:
+        if args.real_models or args.osm_fixture:
+            parser.error("fingerprints.json is recorded with the stub models and the synthetic grid; "
+                         "pass --fingerprints for other setups")
+        args.fingerprints = DEFAULT_FINGERPRINTS
+
+    if args.worker:
+        scenario = next(s for s in SCENARIOS if s['name'] == args.worker)
+        result = run_scenario(
+            scenario, args.work_dir, args.repeats, args.warmup, not args.real_models, args.firestore_latency_ms
+        )
+        print(json.dumps(result))
+        return 0
+
+    drifted = shared_module_drift()
+    if drifted:
+        for filename, service in drifted:
+            print(f"{service}/{filename} differs from the other services' copy")
+        return 1
+
+    scenarios = [s for s in SCENARIOS if not args.only or any(s['name'].startswith(o) for o in args.only)]
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='route_finder_bench_')
+    if any(s['service'] == 'path_finder' for s in scenarios):
+        mismatches = engine_mismatches()
+        for name, bad in mismatches.items():
+            print(f"{name} vs dijkstra: {len(bad)} mismatches over {ENGINE_CHECK_PAIRS} pairs")
+            for mismatch in bad[:5]:
+                print(f"  {mismatch}")
+        if any(mismatches.values()):
+            return 1
+
+        hierarchy = any(s.get('engine') == 'ch' for s in scenarios)
+        if not is_prepared(work_dir, hierarchy):
+            print(f"Seeded walk graph: {prepare(work_dir, args.osm_fixture, hierarchy)}")
+
+    def read_scenarios(path):
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)['scenarios']
+
+    fingerprints = read_scenarios(args.fingerprints)
+    baseline = read_scenarios(args.baseline)
+
+    results, failures = [], {}
+    for scenario in scenarios:
+        # One fresh interpreter per scenario so startup and RSS are not shared
+        command = [
+            sys.executable, __file__, '--worker', scenario['name'], '--work-dir', work_dir,
+            '--repeats', str(args.repeats), '--warmup', str(args.warmup),
+            '--firestore-latency-ms', str(args.firestore_latency_ms),
+        ]
+        if args.real_models:
+            command.append('--real-models')
+        out = subprocess.run(command, capture_output=True, text=True)
+        if out.returncode != 0:
+            print(f"{scenario['name']}: worker failed\n{out.stderr.strip()}", file=sys.stderr)
+            failures[scenario['name']] = ["worker failed"]
+            continue
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        results.append(result)
+        if args.update_baseline:
+            failures[scenario['name']] = compare(
+                result, result['fingerprint'], None, args.latency_tolerance, args.rss_tolerance
+            )
+        else:
+            failures[scenario['name']] = compare(
+                result, fingerprints.get(scenario['name']), baseline.get(scenario['name']),
+                args.latency_tolerance, args.rss_tolerance,
+            )
+
+    print_table(results, failures)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        # Only scenarios that passed: a broken response must not become the expectation
+        passed = [r for r in results if not failures[r['name']]]
+        recorded_at = time.strftime('%Y-%m-%d %H:%M:%S')
+        with open(args.fingerprints, 'w') as f:
+            merged = {**fingerprints, **{r['name']: r['fingerprint'] for r in passed}}
+            json.dump({"scenarios": merged}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        with open(args.baseline, 'w') as f:
+            merged = {**baseline, **{r['name']: r for r in passed}}
+            json.dump({"recorded_at": recorded_at, "scenarios": merged}, f, indent=2, sort_keys=True)
+        print(f"Fingerprints written to {args.fingerprints}, latency/RSS baseline to {args.baseline}")
+    elif results and not any(r['name'] in baseline for r in results):
+        print(f"No latency/RSS baseline in {args.baseline} (run with --update-baseline on this machine)")
+    failed = [name for name, messages in failures.items() if messages]
+    if failed:
+        print(f"{len(failed)} scenario(s) failed: {', '.join(failed)}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,206 @@
+import json
+import math
+import os
+import random
+
+# --- SCENARIOS ---
+# Each scenario is one request payload sent repeatedly to one service.
+# Payloads are generated from a fixed seed, so a scenario always sends the same
+# request and its response fingerprint only changes when the service's results do.
+
+SEED = 1234
+# Synthetic walk graph: a jittered square grid around Porto's centre
+GRID_CENTER = (41.1496, -8.6109)
+GRID_SIZE = 80
+GRID_SPACING_M = 40
+# Route points are drawn from nodes within this radius of the centre, so every
+# bbox a request covers stays inside the seeded tiles
+POINT_RADIUS_M = 400
+REGION = 'benchmark'
+# Engines are checked against Dijkstra on a smaller grid (contraction is pure Python)
+ENGINE_CHECK_GRID_SIZE = 30
+ENGINE_CHECK_PAIRS = 300
+
+SCENARIOS = [
+    # path_finder: tour size drives the matrix (one search per source) and the TSP
+    *[
+        {"name": f"route_wp{n}", "service": "path_finder", "waypoints": n}
+        for n in (0, 2, 5, 10)
+    ],
+    {"name": "route_wp10_astar", "service": "path_finder", "waypoints": 10, "engine": "astar"},
+    {"name": "route_wp10_ch", "service": "path_finder", "waypoints": 10, "engine": "ch"},
+    {"name": "route_wp10_polyline", "service": "path_finder", "waypoints": 10, "output": "polyline", "simplify_tolerance": 5},
+    {"name": "route_wp5_edge_snap", "service": "path_finder", "waypoints": 5, "snap": "edge"},
+    # Orienteering: scored candidates, only a subset fits the budget (deadline high enough not to cut the search)
+    {"name": "route_orienteering_30", "service": "path_finder", "waypoints": 30, "max_distance": 2000, "deadline_ms": 5000},
+
+    # natural_language_processing: keyword batch size (one batched forward pass per request)
+    {"name": "nlp_legacy_keyword", "service": "natural_language_processing", "queries": 1, "legacy": True},
+    *[
+        {"name": f"nlp_batch{n}", "service": "natural_language_processing", "queries": n}
+        for n in (1, 8, 32, 64)
+    ],
+    # Multi-intent inputs ("sushi and live music"): whole phrase plus one match per segment
+    {"name": "nlp_multi_intent8", "service": "natural_language_processing", "queries": 8, "conjunction": " and "},
+
+    # sentiment_analysis: places x reviews; 'cold' clears the verdict cache before every request
+    *[
+        {"name": f"sentiment_{p}x{r}", "service": "sentiment_analysis", "places": p, "reviews": r}
+        for p, r in ((10, 5), (50, 10), (100, 20))
+    ],
+    {"name": "sentiment_50x10_cold", "service": "sentiment_analysis", "places": 50, "reviews": 10, "cold": True},
+]
+
+SERVICES = {
+    "path_finder": "get_route",
+    "natural_language_processing": "match_keywords",
+    "sentiment_analysis": "filter_places_sentiment",
+}
+
+
+# --- WALK GRAPH ---
+def synthetic_walk_graph(center=GRID_CENTER, size=GRID_SIZE, spacing=GRID_SPACING_M, seed=SEED):
+    """
+    OSMnx-shaped MultiDiGraph (nodes with x/y, edges with length in meters):
+    a size x size grid with jittered node positions, walkable both ways.
+    """
+    import networkx as nx
+
+    rng = random.Random(seed)
+    lat0, lng0 = center
+    d_lat = spacing / 111000
+    d_lng = spacing / (111000 * math.cos(math.radians(lat0)))
+
+    graph = nx.MultiDiGraph(crs='epsg:4326')
+    half = size // 2
+    for row in range(size):
+        for col in range(size):
+            graph.add_node(
+                1_000_000 + row * size + col,
+                y=lat0 + (row - half + rng.uniform(-0.2, 0.2)) * d_lat,
+                x=lng0 + (col - half + rng.uniform(-0.2, 0.2)) * d_lng,
+            )
+
+    for row in range(size):
+        for col in range(size):
+            u = 1_000_000 + row * size + col
+            for d_row, d_col in ((0, 1), (1, 0)):
+                if row + d_row >= size or col + d_col >= size:
+                    continue
+                v = 1_000_000 + (row + d_row) * size + col + d_col
+                length = haversine_m(graph.nodes[u]['y'], graph.nodes[u]['x'], graph.nodes[v]['y'], graph.nodes[v]['x'])
+                graph.add_edge(u, v, 0, length=length)
+                graph.add_edge(v, u, 0, length=length)
+    return graph
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    return 2 * 6371000 * math.asin(math.sqrt(a))
+
+
+def prepare_graph(work_dir, osm_fixture=None, hierarchy=False):
+    """
+    Seeds the offline tile cache (and one region CSR over it) in work_dir/graphs
+    from the synthetic grid or an OSM XML fixture, and writes the candidate
+    route points next to it. hierarchy=True also contracts the region for the
+    'ch' scenarios (about a minute for the default grid, once per work dir).
+    Must run with ROUTE_GRAPH_CACHE_DIR already pointing at work_dir/graphs.
+    """
+    import graph_store
+
+    if osm_fixture:
+        import osmnx as ox
+        graph = ox.graph_from_xml(osm_fixture, bidirectional=True, retain_all=True)
+        center = (
+            sum(y for _, y in graph.nodes(data='y')) / graph.number_of_nodes(),
+            sum(x for _, x in graph.nodes(data='x')) / graph.number_of_nodes(),
+        )
+    else:
+        graph = synthetic_walk_graph()
+        center = GRID_CENTER
+
+    tiles = graph_store.seed_from_graph(graph, region=REGION, hierarchy=hierarchy)
+    points = [
+        (data['y'], data['x']) for _, data in graph.nodes(data=True)
+        if haversine_m(center[0], center[1], data['y'], data['x']) <= POINT_RADIUS_M
+    ]
+    with open(os.path.join(work_dir, 'route_points.json'), 'w') as f:
+        json.dump(sorted(points), f)
+    return {"tiles": len(tiles), "nodes": graph.number_of_nodes(), "edges": graph.number_of_edges(), "points": len(points)}
+
+
+# --- PAYLOADS ---
+def route_payload(scenario, work_dir):
+    with open(os.path.join(work_dir, 'route_points.json')) as f:
+        points = json.load(f)
+    rng = random.Random(f"{SEED}-{scenario['name']}")
+    chosen = rng.sample(points, scenario['waypoints'] + 2)
+    as_dict = [{"lat": lat, "lng": lng} for lat, lng in chosen]
+
+    payload = {"start": as_dict[0], "end": as_dict[1], "waypoints": as_dict[2:]}
+    if 'max_distance' in scenario:
+        for waypoint in payload['waypoints']:
+            waypoint['score'] = rng.randint(1, 10)
+    for key in ('engine', 'snap', 'output', 'simplify_tolerance', 'solver', 'max_distance', 'deadline_ms'):
+        if key in scenario:
+            payload[key] = scenario[key]
+    return payload
+
+
+_KEYWORDS = [
+    "hungry", "coffee", "somewhere to dance", "museum and art", "quiet place to read",
+    "cheap beer", "kids playground", "sushi", "view of the river", "vintage clothes",
+    "pharmacy", "place to swim", "live music", "bakery", "garden walk", "souvenirs",
+]
+
+
+def nlp_payload(scenario, work_dir):
+    rng = random.Random(f"{SEED}-{scenario['name']}")
+    joiner = scenario.get('conjunction', ' ')
+    queries = [f"{rng.choice(_KEYWORDS)}{joiner}{rng.choice(_KEYWORDS)}" for _ in range(scenario['queries'])]
+    if scenario.get('legacy'):
+        return {"keywords": queries[0].split()}
+    return {"queries": queries, "top_k": 3}
+
+
+_GOOD_REVIEWS = [
+    "Amazing food and friendly staff, will come back!",
+    "Lovely garden, a bit crowded on weekends.",
+    "Best coffee in town.",
+    "Great views from the top and a nice walk along the river.",
+]
+_BAD_REVIEWS = [
+    "Dirty tables and we waited an hour for cold soup.",
+    "Overpriced tickets and half the exhibits were closed.",
+    "Rude security guard.",
+    "Awful service, bad music.",
+]
+
+
+def sentiment_fixture(scenario):
+    """
+    (Firestore documents, request payload). Roughly a tenth of the places have
+    no document and a tenth too few reviews, so the Google-rating fallback runs too.
+    """
+    rng = random.Random(f"{SEED}-{scenario['name']}")
+    documents = {}
+    places = []
+    for i in range(scenario['places']):
+        place_id = f"place_{i:04d}"
+        places.append({"placeId": place_id, "name": f"Place {i}", "rating": round(rng.uniform(2.0, 5.0), 1)})
+        kind = rng.random()
+        if kind < 0.1:
+            continue
+        count = 2 if kind < 0.2 else scenario['reviews']
+        negative_share = rng.choice((0.1, 0.3, 0.7))
+        ratings = []
+        for _ in range(count):
+            bad = rng.random() < negative_share
+            review = {"rating": rng.randint(1, 2) if bad else rng.randint(4, 5)}
+            if rng.random() < 0.85:
+                review["review"] = rng.choice(_BAD_REVIEWS if bad else _GOOD_REVIEWS) + f" #{rng.randint(0, 999)}"
+            ratings.append(review)
+        documents[place_id] = {"ratings": ratings}
+    return {"places": documents}, {"places": places}
@@ -0,0 +1,93 @@
+# Google Place Category Types
+CATEGORIES = ['car_dealer','car_rental','car_repair','car_wash','electric_vehicle_charging_station','gas_station','parking','rest_stop','corporate_office','farm','ranch','art_gallery','art_studio','auditorium','cultural_landmark','historical_place','monument','museum','performing_arts_theater','sculpture','library','preschool','primary_school','school','secondary_school','university','adventure_sports_center','amphitheatre','amusement_center','amusement_park','aquarium','banquet_hall','barbecue_area','botanical_garden','bowling_alley','casino','childrens_camp','comedy_club','community_center','concert_hall','convention_center','cultural_center','cycling_park','dance_hall','dog_park','event_venue','ferris_wheel','garden','hiking_area','historical_landmark','internet_cafe','karaoke','marina','movie_rental','movie_theater','national_park','night_club','observation_deck','off_roading_area','opera_house','park','philharmonic_hall','picnic_ground','planetarium','plaza','roller_coaster','skateboard_park','state_park','tourist_attraction','video_arcade','visitor_center','water_park','wedding_venue','wildlife_park','wildlife_refuge','zoo','public_bath','public_bathroom','stable','accounting','atm','bank','acai_shop','afghani_restaurant','african_restaurant','american_restaurant','asian_restaurant','bagel_shop','bakery','bar','bar_and_grill','barbecue_restaurant','brazilian_restaurant','breakfast_restaurant','brunch_restaurant','buffet_restaurant','cafe','cafeteria','candy_store','cat_cafe','chinese_restaurant','chocolate_factory','chocolate_shop','coffee_shop','confectionery','deli','dessert_restaurant','dessert_shop','diner','dog_cafe','donut_shop','fast_food_restaurant','fine_dining_restaurant','food_court','french_restaurant','greek_restaurant','hamburger_restaurant','ice_cream_shop','indian_restaurant','indonesian_restaurant','italian_restaurant','japanese_restaurant','juice_shop','korean_restaurant','lebanese_restaurant','meal_delivery','meal_takeaway','mediterranean_restaurant','mexican_restaurant','middle_eastern_restaurant','pizza_restaurant','pub','ramen_restaurant','restaurant','sandwich_shop','seafood_restaurant','spanish_restaurant','steak_house','sushi_restaurant','tea_house','thai_restaurant','turkish_restaurant','vegan_restaurant','vegetarian_restaurant','vietnamese_restaurant','wine_bar','administrative_area_level_1','administrative_area_level_2','country','locality','postal_code','school_district','city_hall','courthouse','embassy','fire_station','government_office','local_government_office','neighborhood_police_station','police','post_office','chiropractor','dental_clinic','dentist','doctor','drugstore','hospital','massage','medical_lab','pharmacy','physiotherapist','sauna','skin_care_clinic','spa','tanning_studio','wellness_center','yoga_studio','apartment_building','apartment_complex','condominium_complex','housing_complex','bed_and_breakfast','budget_japanese_inn','campground','camping_cabin','cottage','extended_stay_hotel','farmstay','guest_house','hostel','hotel','inn','japanese_inn','lodging','mobile_home_park','motel','private_guest_room','resort_hotel','rv_park','beach','church','hindu_temple','mosque','synagogue','astrologer','barber_shop','beautician','beauty_salon','body_art_service','catering_service','cemetery','child_care_agency','consultant','courier_service','electrician','florist','food_delivery','foot_care','funeral_home','hair_care','hair_salon','insurance_agency','laundry','lawyer','locksmith','makeup_artist','moving_company','nail_salon','painter','plumber','psychic','real_estate_agency','roofing_contractor','storage','summer_camp_organizer','tailor','telecommunications_service_provider','tour_agency','tourist_information_center','travel_agency','veterinary_care','asian_grocery_store','auto_parts_store','bicycle_store','book_store','butcher_shop','cell_phone_store','clothing_store','convenience_store','department_store','discount_store','electronics_store','food_store','furniture_store','gift_shop','grocery_store','hardware_store','home_goods_store','home_improvement_store','jewelry_store','liquor_store','market','pet_store','shoe_store','shopping_mall','sporting_goods_store','store','supermarket','warehouse_store','wholesaler','arena','athletic_field','fishing_charter','fishing_pond','fitness_center','golf_course','gym','ice_skating_rink','playground','ski_resort','sports_activity_location','sports_club','sports_coaching','sports_complex','stadium','swimming_pool','airport','airstrip','bus_station','bus_stop','ferry_terminal','heliport','international_airport','light_rail_station']
+
+# Extra phrasings matched to a category besides its own name: synonyms and short
+# descriptions of what people ask for. Extend or override at runtime with
+# NLP_VOCABULARY_PATH (see vocabulary.py).
+SYNONYMS = {
+    'cafe': ['coffee', 'espresso', 'a place for coffee and cake', 'somewhere to sit and have a coffee'],
+    'coffee_shop': ['coffee to go', 'specialty coffee', 'latte', 'cappuccino'],
+    'tea_house': ['tea', 'a cup of tea', 'tea room'],
+    'bakery': ['bread', 'pastries', 'croissant', 'pastel de nata', 'fresh baked goods'],
+    'dessert_shop': ['something sweet', 'cake', 'sweets'],
+    'ice_cream_shop': ['ice cream', 'gelato', 'frozen yogurt'],
+    'chocolate_shop': ['chocolate', 'pralines'],
+    'restaurant': ['hungry', 'food', 'dinner', 'lunch', 'a place to eat', 'somewhere to have a meal'],
+    'fast_food_restaurant': ['quick bite', 'fast food', 'cheap quick food'],
+    'fine_dining_restaurant': ['fancy dinner', 'gourmet', 'tasting menu', 'romantic dinner'],
+    'breakfast_restaurant': ['breakfast', 'morning food', 'eggs and toast'],
+    'brunch_restaurant': ['brunch', 'late breakfast on the weekend'],
+    'seafood_restaurant': ['seafood', 'fish', 'grilled sardines', 'octopus', 'codfish'],
+    'sushi_restaurant': ['sushi', 'sashimi', 'maki'],
+    'japanese_restaurant': ['ramen and sushi', 'japanese food'],
+    'pizza_restaurant': ['pizza', 'slice of pizza'],
+    'italian_restaurant': ['pasta', 'risotto', 'italian food'],
+    'hamburger_restaurant': ['burger', 'cheeseburger'],
+    'steak_house': ['steak', 'grilled meat'],
+    'vegan_restaurant': ['vegan food', 'plant based'],
+    'vegetarian_restaurant': ['vegetarian food', 'meat free'],
+    'sandwich_shop': ['sandwich', 'francesinha', 'bifana', 'sub'],
+    'bar': ['drinks', 'a drink', 'cocktails', 'beer', 'cheap beer', 'somewhere to drink'],
+    'pub': ['pint', 'draught beer', 'pub quiz'],
+    'wine_bar': ['wine', 'port wine tasting', 'glass of wine'],
+    'night_club': ['dancing', 'somewhere to dance', 'party', 'clubbing', 'nightlife', 'dj'],
+    'karaoke': ['sing', 'karaoke night'],
+    'comedy_club': ['stand up comedy', 'something funny'],
+    'concert_hall': ['live music', 'concert', 'orchestra'],
+    'performing_arts_theater': ['theatre', 'play', 'show', 'ballet'],
+    'movie_theater': ['cinema', 'movies', 'watch a film'],
+    'museum': ['history', 'exhibition', 'museum and art', 'learn something', 'rainy day indoor culture'],
+    'art_gallery': ['art', 'paintings', 'contemporary art', 'exhibition of artworks'],
+    'historical_landmark': ['old buildings', 'landmark', 'heritage'],
+    'monument': ['statue', 'memorial'],
+    'church': ['cathedral', 'chapel', 'azulejos church'],
+    'tourist_attraction': ['sightseeing', 'must see', 'famous place', 'things to see'],
+    'observation_deck': ['viewpoint', 'view of the city', 'panoramic view', 'miradouro', 'view of the river'],
+    'library': ['books to read', 'quiet place to read', 'study', 'quiet place to work'],
+    'book_store': ['books', 'bookshop', 'buy a book'],
+    'park': ['green space', 'walk in nature', 'fresh air', 'trees and grass', 'garden walk'],
+    'garden': ['flowers', 'gardens'],
+    'botanical_garden': ['plants', 'greenhouse', 'exotic plants'],
+    'playground': ['kids', 'children', 'kids playground', 'slides and swings'],
+    'zoo': ['animals', 'see animals'],
+    'aquarium': ['fish tank', 'sea life', 'sharks'],
+    'beach': ['sea', 'sand', 'swim in the sea', 'sunbathe', 'ocean'],
+    'swimming_pool': ['swim', 'place to swim', 'pool', 'laps'],
+    'gym': ['workout', 'exercise', 'weights', 'fitness'],
+    'yoga_studio': ['yoga', 'meditation class', 'pilates'],
+    'spa': ['relax', 'massage and sauna', 'wellness', 'pampering'],
+    'hair_salon': ['haircut', 'hairdresser'],
+    'barber_shop': ['barber', 'beard trim', 'shave'],
+    'pharmacy': ['medicine', 'painkillers', 'first aid', 'prescription'],
+    'hospital': ['emergency', 'injured', 'urgent care'],
+    'doctor': ['feel sick', 'medical appointment', 'clinic'],
+    'atm': ['cash', 'withdraw money', 'cash machine'],
+    'supermarket': ['groceries', 'food shopping', 'water and snacks'],
+    'convenience_store': ['snacks', 'corner shop', 'late night shop'],
+    'market': ['farmers market', 'fresh produce', 'local market'],
+    'clothing_store': ['clothes', 'fashion', 'vintage clothes', 'jacket'],
+    'shoe_store': ['shoes', 'sneakers'],
+    'gift_shop': ['souvenirs', 'presents', 'gifts', 'something to take home'],
+    'shopping_mall': ['shopping', 'mall', 'shops'],
+    'electronics_store': ['phone charger', 'headphones', 'electronics'],
+    'hotel': ['place to stay', 'room for the night', 'accommodation', 'sleep'],
+    'hostel': ['cheap place to stay', 'dorm bed', 'backpackers'],
+    'public_bathroom': ['toilet', 'restroom', 'wc', 'bathroom'],
+    'parking': ['park the car', 'car park', 'garage'],
+    'gas_station': ['fuel', 'petrol', 'gas'],
+    'bus_stop': ['bus', 'catch a bus'],
+    'light_rail_station': ['metro', 'subway', 'tram', 'train into town'],
+    'ferry_terminal': ['boat', 'ferry', 'river cruise'],
+    'bicycle_store': ['bike repair', 'bicycle'],
+    'dog_park': ['walk the dog', 'off leash area'],
+    'amusement_park': ['rides', 'theme park', 'roller coasters'],
+    'video_arcade': ['arcade games', 'video games'],
+    'bowling_alley': ['bowling'],
+    'stadium': ['football match', 'soccer game', 'sports event'],
+    'hiking_area': ['hike', 'trail', 'trekking'],
+    'picnic_ground': ['picnic'],
+    'laundry': ['wash clothes', 'laundromat'],
+    'post_office': ['send a letter', 'stamps', 'mail a package'],
+    'police': ['report a theft', 'lost passport', 'police station'],
+    'tourist_information_center': ['tourist info', 'maps and tourist advice'],
+}
@@ -0,0 +1,264 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# --- VOCABULARY EMBEDDING ARTIFACT ---
+# The normalized vocabulary matrix (one row per (category, phrase) entry, see
+# vocabulary.py) is saved as a plain .npy (float32) plus a .json sidecar with
+# the entries in row order. The file name carries the model name and a hash of
+# the entries, so any change to either makes the old artifact stale automatically.
+#
+# Large vocabularies get an IVF index: rows are clustered with spherical k-means
+# (~sqrt(N) lists) and stored grouped by list, centroids in a .centroids.npy next
+# to them. A query scores the centroids, then only the rows of its nprobe best
+# lists. Below NLP_ANN_MIN_ENTRIES rows one exact matmul is faster and is used instead.
+
+FORMAT_VERSION = 2
+ARTIFACT_DIR = os.environ.get(
+    'NLP_INDEX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'artifacts')
+)
+ANN_MIN_ENTRIES = int(os.environ.get('NLP_ANN_MIN_ENTRIES', 2048))
+ANN_NPROBE = int(os.environ.get('NLP_ANN_NPROBE', 8))
+IVF_ITERATIONS = 15
+IVF_SEED = 0
+# Entries fetched per wanted category: several phrasings of one category tend to rank together
+CATEGORY_OVERSAMPLE = 4
+
+
+def entries_hash(entries):
+    return hashlib.sha256(json.dumps([list(e) for e in entries]).encode()).hexdigest()
+
+
+def artifact_path(model_name, entries, directory=ARTIFACT_DIR):
+    model_slug = model_name.replace('/', '__')
+    return os.path.join(directory, f"vocabulary-{model_slug}-{entries_hash(entries)[:16]}.v{FORMAT_VERSION}.npy")
+
+
+def _sidecar_paths(path):
+    base = path[:-len('.npy')]
+    return base + '.json', base + '.centroids.npy'
+
+
+def encode_categories(model, texts):
+    """Unit-length float32 rows, so cosine similarity is a plain dot product."""
+    embeddings = model.encode(list(texts), convert_to_numpy=True, normalize_embeddings=True)
+    return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+
+def top_k(query_embeddings, category_embeddings, k):
+    """
+    (scores, indices) of the k best rows per query, best first.
+    Queries must be normalized; one matmul + argpartition over all rows.
+    """
+    scores = query_embeddings @ category_embeddings.T
+    k = min(k, scores.shape[1])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1)
+    return np.take_along_axis(part_scores, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+
+# --- IVF ---
+def train_ivf(vectors, nlist, iterations=IVF_ITERATIONS, seed=IVF_SEED):
+    """Spherical k-means: (unit centroids, list of every row)."""
+    rng = np.random.default_rng(seed)
+    centroids = np.array(vectors[rng.choice(len(vectors), nlist, replace=False)], dtype=np.float32)
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # A list that lost all its rows keeps its old centroid
+        centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids).astype(np.float32)
+    return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+
+class VocabularyIndex:
+    def __init__(self, entries, vectors, centroids=None, offsets=None, nprobe=ANN_NPROBE):
+        """entries/vectors in row order; with centroids, list c owns rows offsets[c]:offsets[c + 1]."""
+        self.entries = entries
+        self.categories = [category for category, _ in entries]
+        self.vectors = vectors
+        self.centroids = centroids
+        self.offsets = offsets
+        self.nprobe = nprobe
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def kind(self):
+        return 'flat' if self.centroids is None else f"ivf{len(self.centroids)}"
+
+    @classmethod
+    def build(cls, entries, vectors, min_entries=ANN_MIN_ENTRIES):
+        if len(entries) < min_entries:
+            return cls(entries, vectors)
+        nlist = int(np.sqrt(len(entries)))
+        centroids, assignment = train_ivf(vectors, nlist)
+        # Drop lists that ended up empty, so every probe scores some rows
+        used = np.unique(assignment)
+        centroids, assignment = centroids[used], np.searchsorted(used, assignment)
+        order = np.argsort(assignment, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment))])
+        return cls([entries[i] for i in order], np.ascontiguousarray(vectors[order]), centroids, offsets)
+
+    def _probe(self, queries):
+        """(scores, rows) per query over the rows of its nprobe best lists."""
+        _, probes = top_k(queries, self.centroids, self.nprobe)
+        for query, lists in zip(queries, probes):
+            rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in lists])
+            yield self.vectors[rows] @ query, rows
+
+    def search(self, queries, k):
+        """[(scores, rows)] per query: its k best entries, best first."""
+        if self.centroids is None:
+            return list(zip(*top_k(queries, self.vectors, k)))
+
+        results = []
+        for scores, rows in self._probe(queries):
+            kk = min(k, len(rows))
+            if kk == 0:
+                results.append((scores, rows))
+                continue
+            part = np.argpartition(-scores, kk - 1)[:kk]
+            best = part[np.argsort(-scores[part])]
+            results.append((scores[best], rows[best]))
+        return results
+
+    def top_categories(self, queries, k):
+        """[(category, score)] per query: the k best categories, each scored by its best phrasing."""
+        ranked = []
+        for scores, rows in self.search(queries, k * CATEGORY_OVERSAMPLE):
+            best = {}
+            for score, row in zip(scores.tolist(), rows.tolist()):
+                best.setdefault(self.categories[row], score)
+                if len(best) == k:
+                    break
+            ranked.append(list(best.items()))
+        return ranked
+
+    def categories_above(self, queries, threshold, limit):
+        """
+        [(category, score)] per query: every category whose best phrasing scores
+        at least `threshold` (over all rows, or the probed lists with IVF), best
+        first, at most `limit` of them.
+        """
+        if self.centroids is None:
+            rows = np.arange(len(self.entries))
+            scored = ((scores, rows) for scores in queries @ self.vectors.T)
+        else:
+            scored = self._probe(queries)
+        matched = []
+        for scores, rows in scored:
+            keep = np.flatnonzero(scores >= threshold)
+            if not len(keep):
+                matched.append([])
+                continue
+            keep = keep[np.argsort(-scores[keep], kind='stable')]
+            best = {}
+            for i in keep.tolist():
+                best.setdefault(self.categories[rows[i]], float(scores[i]))
+                if len(best) == limit:
+                    break
+            matched.append(list(best.items()))
+        return matched
+
+
+# --- ARTIFACT ---
+def save_index(index, model_name, entries, directory=ARTIFACT_DIR):
+    """Saves under the hash of `entries` (the order they were built from, not the row order)."""
+    os.makedirs(directory, exist_ok=True)
+    path = artifact_path(model_name, entries, directory)
+    meta_path, centroids_path = _sidecar_paths(path)
+    tmp = f".{os.getpid()}.tmp"
+
+    # Sidecars first: the .npy appearing is what makes the artifact visible
+    if index.centroids is not None:
+        np.save(centroids_path + tmp + '.npy', index.centroids)
+        os.replace(centroids_path + tmp + '.npy', centroids_path)
+    with open(meta_path + tmp, 'w') as f:
+        json.dump({
+            "model": model_name,
+            "entries_sha256": entries_hash(entries),
+            "count": len(index),
+            "dim": int(index.vectors.shape[1]),
+            "kind": index.kind,
+            "offsets": None if index.offsets is None else [int(o) for o in index.offsets],
+            "entries": [list(e) for e in index.entries],
+            "format_version": FORMAT_VERSION,
+        }, f)
+    os.replace(meta_path + tmp, meta_path)
+    np.save(path + tmp + '.npy', index.vectors)
+    os.replace(path + tmp + '.npy', path)
+    return path
+
+
+def load_index(model_name, entries, directory=ARTIFACT_DIR, min_entries=ANN_MIN_ENTRIES):
+    """
+    Memory-maps the artifact (no copy, no parsing of the matrix). None if
+    missing, stale, or built flat/IVF while the current settings want the other.
+    """
+    path = artifact_path(model_name, entries, directory)
+    meta_path, centroids_path = _sidecar_paths(path)
+    if not os.path.exists(path) or not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    vectors = np.load(path, mmap_mode='r')
+    if vectors.shape[0] != len(entries) or meta["count"] != len(entries):
+        return None
+    if (meta["offsets"] is not None) != (len(entries) >= min_entries):
+        return None
+    centroids = offsets = None
+    if meta["offsets"] is not None:
+        centroids = np.load(centroids_path)
+        offsets = np.array(meta["offsets"])
+    return VocabularyIndex([tuple(e) for e in meta["entries"]], vectors, centroids, offsets)
+
+
+def load_or_build(model, model_name, entries, log=print, directory=ARTIFACT_DIR, encode=True):
+    """
+    Cold-start (and reload) path: use the prebuilt artifact if it matches the
+    model and vocabulary, otherwise encode the entries (and try to save them).
+    With encode=False a missing artifact gives None instead.
+    """
+    index = load_index(model_name, entries, directory)
+    if index is not None:
+        log(f"Vocabulary index ({index.kind}, {len(index)} entries) loaded from {artifact_path(model_name, entries, directory)}")
+        return index
+    if not encode:
+        log("Vocabulary index missing or stale, leaving the encoding to first use")
+        return None
+
+    log(f"Vocabulary index missing or stale, encoding {len(entries)} entries...")
+    vectors = encode_categories(model, [text for _, text in entries])
+    index = VocabularyIndex.build(entries, vectors)
+    try:
+        save_index(index, model_name, entries, directory)
+    except OSError as e:
+        # Read-only deploy directory: keep serving from memory
+        log(f"Could not save vocabulary index: {e}")
+    return index
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from onnx_backend import BACKENDS, load_encoder
+    from vocabulary import load_entries
+
+    parser = argparse.ArgumentParser(description="Build the vocabulary embedding artifact for the NLP service")
+    parser.add_argument('--model', default=os.environ.get('NLP_MODEL_NAME', 'all-MiniLM-L6-v2'))
+    parser.add_argument('--backend', choices=BACKENDS, default=os.environ.get('NLP_BACKEND', 'torch'))
+    parser.add_argument('--onnx-dir', default=os.environ.get('NLP_ONNX_DIR'))
+    parser.add_argument('--vocabulary', default=os.environ.get('NLP_VOCABULARY_PATH'), help="Extra phrasings JSON")
+    parser.add_argument('--out', default=ARTIFACT_DIR)
+    args = parser.parse_args()
+
+    encoder, index_key = load_encoder(args.backend, args.model, args.onnx_dir)
+    vocabulary = load_entries(args.vocabulary)
+    built = VocabularyIndex.build(vocabulary, encode_categories(encoder, [text for _, text in vocabulary]))
+    print(f"Saved {built.kind} index of {len(built)} entries to {save_index(built, index_key, vocabulary, args.out)}")
@@ -0,0 +1,32 @@
+import multiprocessing
+import os
+import sys
+
+# --- MULTI-WORKER SERVING ---
+#   gunicorn -c gunicorn.conf.py wsgi:app
+# The app (and with it the model and the category index) is imported once in the
+# master, then workers are forked, so the weights are shared copy-on-write
+# instead of loaded once per process. Each worker serves WEB_THREADS requests at
+# a time; set NLP_/SENTIMENT_MICROBATCH_WINDOW_MS so they share forward passes.
+# Build model artifacts (category index, ONNX export) ahead of deploy: running
+# inference in the master before fork can leave its thread pools unusable in
+# the workers. WEB_PRELOADING is set while the master imports the app, so the
+# services can leave any missing artifact to the workers instead.
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('WEB_THREADS', 8))
+worker_class = 'gthread'
+preload_app = True
+# Cloud Run enforces the request timeout itself
+timeout = 0
+
+os.environ['WEB_PRELOADING'] = '1'
+
+
+def post_fork(server, worker):
+    os.environ.pop('WEB_PRELOADING', None)
+    # Split the cores between workers instead of every worker spinning up one thread per core
+    torch = sys.modules.get('torch')
+    if torch is not None:
+        torch.set_num_threads(max(1, multiprocessing.cpu_count() // workers))
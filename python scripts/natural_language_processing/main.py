@@ -1,39 +1,182 @@
 import functions_framework
 from flask import jsonify
-from sentence_transformers import SentenceTransformer, util
-import torch
+import numpy as np
+import os
+import re
+import threading
+from collections import OrderedDict
+import category_index
+from vocabulary import ReloadingIndex
+from onnx_backend import load_encoder
+from instrumentation import Trace, count, span
+from microbatch import MicroBatcher
 
 # --- 1. GLOBAL SETUP (Runs once on cold start) ---
 print("Loading NLP model...")
 # Using a light and fast model
-model = SentenceTransformer('all-MiniLM-L6-v2')
+MODEL_NAME = os.environ.get('NLP_MODEL_NAME', 'all-MiniLM-L6-v2')
+# 'torch' (default) or 'onnx' (int8 onnxruntime, no PyTorch import); see onnx_backend.py
+NLP_BACKEND = os.environ.get('NLP_BACKEND', 'torch')
+model, INDEX_KEY = load_encoder(NLP_BACKEND, MODEL_NAME, os.environ.get('NLP_ONNX_DIR'))
+print(f"NLP backend: {NLP_BACKEND}")
 
-# Google Place Category Types
-CATEGORIES = ['car_dealer','car_rental','car_repair','car_wash','electric_vehicle_charging_station','gas_station','parking','rest_stop','corporate_office','farm','ranch','art_gallery','art_studio','auditorium','cultural_landmark','historical_place','monument','museum','performing_arts_theater','sculpture','library','preschool','primary_school','school','secondary_school','university','adventure_sports_center','amphitheatre','amusement_center','amusement_park','aquarium','banquet_hall','barbecue_area','botanical_garden','bowling_alley','casino','childrens_camp','comedy_club','community_center','concert_hall','convention_center','cultural_center','cycling_park','dance_hall','dog_park','event_venue','ferris_wheel','garden','hiking_area','historical_landmark','internet_cafe','karaoke','marina','movie_rental','movie_theater','national_park','night_club','observation_deck','off_roading_area','opera_house','park','philharmonic_hall','picnic_ground','planetarium','plaza','roller_coaster','skateboard_park','state_park','tourist_attraction','video_arcade','visitor_center','water_park','wedding_venue','wildlife_park','wildlife_refuge','zoo','public_bath','public_bathroom','stable','accounting','atm','bank','acai_shop','afghani_restaurant','african_restaurant','american_restaurant','asian_restaurant','bagel_shop','bakery','bar','bar_and_grill','barbecue_restaurant','brazilian_restaurant','breakfast_restaurant','brunch_restaurant','buffet_restaurant','cafe','cafeteria','candy_store','cat_cafe','chinese_restaurant','chocolate_factory','chocolate_shop','coffee_shop','confectionery','deli','dessert_restaurant','dessert_shop','diner','dog_cafe','donut_shop','fast_food_restaurant','fine_dining_restaurant','food_court','french_restaurant','greek_restaurant','hamburger_restaurant','ice_cream_shop','indian_restaurant','indonesian_restaurant','italian_restaurant','japanese_restaurant','juice_shop','korean_restaurant','lebanese_restaurant','meal_delivery','meal_takeaway','mediterranean_restaurant','mexican_restaurant','middle_eastern_restaurant','pizza_restaurant','pub','ramen_restaurant','restaurant','sandwich_shop','seafood_restaurant','spanish_restaurant','steak_house','sushi_restaurant','tea_house','thai_restaurant','turkish_restaurant','vegan_restaurant','vegetarian_restaurant','vietnamese_restaurant','wine_bar','administrative_area_level_1','administrative_area_level_2','country','locality','postal_code','school_district','city_hall','courthouse','embassy','fire_station','government_office','local_government_office','neighborhood_police_station','police','post_office','chiropractor','dental_clinic','dentist','doctor','drugstore','hospital','massage','medical_lab','pharmacy','physiotherapist','sauna','skin_care_clinic','spa','tanning_studio','wellness_center','yoga_studio','apartment_building','apartment_complex','condominium_complex','housing_complex','bed_and_breakfast','budget_japanese_inn','campground','camping_cabin','cottage','extended_stay_hotel','farmstay','guest_house','hostel','hotel','inn','japanese_inn','lodging','mobile_home_park','motel','private_guest_room','resort_hotel','rv_park','beach','church','hindu_temple','mosque','synagogue','astrologer','barber_shop','beautician','beauty_salon','body_art_service','catering_service','cemetery','child_care_agency','consultant','courier_service','electrician','florist','food_delivery','foot_care','funeral_home','hair_care','hair_salon','insurance_agency','laundry','lawyer','locksmith','makeup_artist','moving_company','nail_salon','painter','plumber','psychic','real_estate_agency','roofing_contractor','storage','summer_camp_organizer','tailor','telecommunications_service_provider','tour_agency','tourist_information_center','travel_agency','veterinary_care','asian_grocery_store','auto_parts_store','bicycle_store','book_store','butcher_shop','cell_phone_store','clothing_store','convenience_store','department_store','discount_store','electronics_store','food_store','furniture_store','gift_shop','grocery_store','hardware_store','home_goods_store','home_improvement_store','jewelry_store','liquor_store','market','pet_store','shoe_store','shopping_mall','sporting_goods_store','store','supermarket','warehouse_store','wholesaler','arena','athletic_field','fishing_charter','fishing_pond','fitness_center','golf_course','gym','ice_skating_rink','playground','ski_resort','sports_activity_location','sports_club','sports_coaching','sports_complex','stadium','swimming_pool','airport','airstrip','bus_station','bus_stop','ferry_terminal','heliport','international_airport','light_rail_station']
+# Vocabulary (categories + synonyms + NLP_VOCABULARY_PATH) vectors come from the
+# prebuilt artifact (memory-mapped, normalized) and are only re-encoded when it is
+# missing or stale; a changed vocabulary file is picked up without a restart
+VOCABULARY_PATH = os.environ.get('NLP_VOCABULARY_PATH')
+VOCABULARY_CHECK_S = float(os.environ.get('NLP_VOCABULARY_CHECK_S', 30))
 
-# Pre-calculate category vectors for speed
-# This avoids recalculating on every user request
-CATEGORY_EMBEDDINGS = model.encode(CATEGORIES, convert_to_tensor=True)
+def build_vocabulary_index(entries):
+    # No encoding in a preloading gunicorn master (see gunicorn.conf.py): the
+    # workers encode a missing artifact on first use
+    preloading = os.environ.get('WEB_PRELOADING') == '1'
+    return category_index.load_or_build(model, INDEX_KEY, entries, encode=not preloading)
+
+vocabulary_index = ReloadingIndex(build_vocabulary_index, VOCABULARY_PATH, VOCABULARY_CHECK_S)
 print("Model and categories loaded successfully.")
 
-def get_best_category_nlp(user_text, dlog):
+# --- 2. EMBEDDING CACHE ---
+# Popular inputs ("hungry", "coffee") are embedded once and then served from memory
+EMBEDDING_CACHE_SIZE = int(os.environ.get('NLP_EMBEDDING_CACHE_SIZE', 4096))
+ENCODE_BATCH_SIZE = int(os.environ.get('NLP_ENCODE_BATCH_SIZE', 64))
+MAX_QUERIES = 64
+MAX_TOP_K = 10
+# Minimum cosine score for a category to count as one of the input's intents
+MATCH_THRESHOLD = float(os.environ.get('NLP_MATCH_THRESHOLD', 0.45))
+# Intents kept per segment, whatever top_k the caller asked for
+MAX_INTENTS = int(os.environ.get('NLP_MAX_INTENTS', 10))
+MAX_SEGMENTS = 8
+
+embedding_cache = OrderedDict()
+cache_lock = threading.Lock()
+
+# --- 3. MICRO-BATCHING ---
+# When served with several threads per worker (see gunicorn.conf.py), cache
+# misses of concurrent requests arriving within the window share one forward
+# pass. 0 (default) encodes each request's misses on its own thread.
+MICROBATCH_WINDOW_MS = float(os.environ.get('NLP_MICROBATCH_WINDOW_MS', 0))
+MICROBATCH_MAX_TEXTS = int(os.environ.get('NLP_MICROBATCH_MAX_TEXTS', 256))
+
+def encode_texts(texts):
+    return model.encode(texts, batch_size=ENCODE_BATCH_SIZE, convert_to_numpy=True, normalize_embeddings=True)
+
+encode_batcher = MicroBatcher(encode_texts, MICROBATCH_MAX_TEXTS, MICROBATCH_WINDOW_MS, name='nlp-encode')
+
+def normalize_query(text):
+    return " ".join(text.split())
+
+def encode_queries(texts, dlog):
+    """
+    Embeds many texts with a single batched forward pass.
+    Repeated strings (within the batch or across requests) skip the model.
+    """
+    keys = [normalize_query(t) for t in texts]
+    found = {}
+    with cache_lock:
+        for key in keys:
+            if key in embedding_cache:
+                embedding_cache.move_to_end(key)
+                found[key] = embedding_cache[key]
+
+    missing = list(dict.fromkeys(k for k in keys if k not in found))
+    dlog(f"Embedding cache: {len(found)} hits, {len(missing)} to encode")
+    count('embedding_cache_hits', len(found))
+    count('embedding_cache_misses', len(missing))
+
+    if missing:
+        count('encode_batches', -(-len(missing) // ENCODE_BATCH_SIZE))
+        with span('encode'):
+            vectors = encode_batcher.submit(missing)
+        with cache_lock:
+            for key, vector in zip(missing, vectors):
+                found[key] = vector
+                embedding_cache[key] = vector
+                embedding_cache.move_to_end(key)
+            while len(embedding_cache) > EMBEDDING_CACHE_SIZE:
+                embedding_cache.popitem(last=False)
+
+    return np.stack([found[k] for k in keys]).astype(np.float32, copy=False)
+
+def _as_matches(rows):
+    return [[{"category": category, "score": round(score, 4)} for category, score in row] for row in rows]
+
+def rank_categories(embeddings, top_k, index=None):
+    """Top-k (category, score) pairs for every row of embeddings."""
+    # Both sides are unit length, so cosine scores are dot products (exact or IVF, see category_index.py)
+    index = index or vocabulary_index.get()
+    with span('rank'):
+        ranked = index.top_categories(embeddings, top_k)
+    count('vocabulary_entries', len(index))
+    return _as_matches(ranked)
+
+def categories_above(embeddings, threshold, index):
+    """Every category scoring at least `threshold` (at most MAX_INTENTS) for every row of embeddings."""
+    with span('intents'):
+        return _as_matches(index.categories_above(embeddings, threshold, MAX_INTENTS))
+
+# "coffee and museum", "cake, then a park" -> one segment per intent
+SEGMENT_SEPARATORS = re.compile(r"\s*(?:[,;/&+|]|\b(?:and|or|then|plus|also|e|ou)\b)\s*", re.IGNORECASE)
+
+def segment(text):
+    segments = [normalize_query(part) for part in SEGMENT_SEPARATORS.split(text)]
+    segments = [s for s in segments if s][:MAX_SEGMENTS]
+    return segments or [normalize_query(text)]
+
+def match_intents(texts, top_k, threshold, dlog):
+    """
+    For every text: top-k matches of the whole phrase (as before), top-k per
+    segment, and the multi-label answer: every category scoring at least
+    `threshold` for some segment (not only those in its top-k), best score
+    first, at most MAX_INTENTS per segment. When the whole phrase outscores
+    all its segments it is kept as a single segment.
+    Whole texts and all their segments are encoded in one batch.
+    """
+    segmented = [segment(text) for text in texts]
+    flat = texts + [s for segments in segmented for s in segments]
+    dlog(f"Processing {len(texts)} texts, {len(flat) - len(texts)} segments (top_k={top_k}, threshold={threshold})")
+    embeddings = encode_queries(flat, dlog)
+    # One index for both, so a reload in between cannot mix vocabularies
+    index = vocabulary_index.get()
+    ranked = rank_categories(embeddings, top_k, index)
+    above = categories_above(embeddings, threshold, index)
+    count('segments', len(flat) - len(texts))
+
+    results = []
+    position = len(texts)
+    for i, (text, matches, segments) in enumerate(zip(texts, ranked, segmented)):
+        part = slice(position, position + len(segments))
+        segment_matches = [{"segment": s, "matches": m} for s, m in zip(segments, ranked[part])]
+        segment_intents = above[part]
+        position += len(segments)
+
+        # A phrase that matches better whole than in pieces ("bed and breakfast") is one intent
+        if len(segments) > 1 and matches[0]["score"] >= max(m["matches"][0]["score"] for m in segment_matches):
+            segment_matches = [{"segment": normalize_query(text), "matches": matches}]
+            segment_intents = [above[i]]
+
+        intents = {}
+        for item, candidates in zip(segment_matches, segment_intents):
+            for match in candidates:
+                if match["score"] > intents.get(match["category"], {}).get("score", -1):
+                    intents[match["category"]] = {**match, "segment": item["segment"]}
+        categories = sorted(intents.values(), key=lambda m: -m["score"])
+        dlog(f"Match: '{text}' -> '{matches[0]['category']}' | Score: {matches[0]['score']:.4f} | Intents: {[m['category'] for m in categories]}")
+        results.append({"query": text, "matches": matches, "segments": segment_matches, "categories": categories})
+    return results
+
+def get_best_category_nlp(user_text, threshold, dlog):
+    """(best category of the whole phrase, every category above threshold across its segments)."""
     dlog(f"Processing input: '{user_text}'")
-    
-    # Convert user text to vector
-    user_embedding = model.encode(user_text, convert_to_tensor=True)
-    
-    # Calculate similarity (Math)
-    cosine_scores = util.cos_sim(user_embedding, CATEGORY_EMBEDDINGS)[0]
-
-    # Check highest score
-    best_score_ind = torch.argmax(cosine_scores).item()
-    best_score = cosine_scores[best_score_ind].item()
-    
-    best_category = CATEGORIES[best_score_ind]
-    
-    dlog(f"Match: '{best_category}' | Score: {best_score:.4f}")
-    
-    return best_category
+    result = match_intents([user_text], 1, threshold, dlog)[0]
+    return result["matches"][0]["category"], result["categories"]
+
+def match_queries(queries, top_k, threshold, dlog):
+    """
+    Batch mode: every query is independent (a string, or a list of keywords
+    joined into one phrase as in single mode) and gets its own top-k.
+    """
+    texts = [q if isinstance(q, str) else " ".join(q) for q in queries]
+    return match_intents(texts, top_k, threshold, dlog)
 
 @functions_framework.http
 def match_keywords(request):
@@ -49,28 +192,61 @@ def match_keywords(request):
 
     headers = {'Access-Control-Allow-Origin': '*'}
 
-    # Initialize Log Buffer
-    log_buffer = []
-    def dlog(msg):
-        log_buffer.append(f"[NLP] {msg}")
+    # Per-request spans, counters and log lines, printed as one JSON entry
+    trace = Trace('natural_language_processing', prefix='[NLP] ')
+    dlog = trace.log
 
     request_json = request.get_json(silent=True)
     if not request_json:
         dlog("Error: No JSON provided")
-        print("\n".join(log_buffer))
+        trace.emit(400)
         return (jsonify({"error": "No JSON provided"}), 400, headers)
 
+    # Intents: categories scoring at least `threshold` for any segment of the input
+    threshold = request_json.get('threshold', MATCH_THRESHOLD)
+    if not isinstance(threshold, (int, float)) or isinstance(threshold, bool) or not -1 <= threshold <= 1:
+        dlog(f"Error: invalid threshold {threshold}")
+        trace.emit(400)
+        return (jsonify({"error": "threshold must be a number between -1 and 1"}), 400, headers)
+
+    # Batch mode: {"queries": ["hungry", ["coffee", "cake"], ...], "top_k": 3}
+    if 'queries' in request_json:
+        queries = request_json['queries']
+        top_k = request_json.get('top_k', 1)
+
+        if not isinstance(queries, list) or not queries or len(queries) > MAX_QUERIES or not all(
+            isinstance(q, str) or (isinstance(q, list) and all(isinstance(k, str) for k in q)) for q in queries
+        ):
+            dlog("Error: queries must be a non-empty list of strings or keyword lists")
+            trace.emit(400)
+            return (jsonify({"error": f"queries must be a list of 1-{MAX_QUERIES} strings or keyword lists"}), 400, headers)
+
+        if not isinstance(top_k, int) or isinstance(top_k, bool) or not 1 <= top_k <= MAX_TOP_K:
+            dlog(f"Error: invalid top_k {top_k}")
+            trace.emit(400)
+            return (jsonify({"error": f"top_k must be an integer between 1 and {MAX_TOP_K}"}), 400, headers)
+
+        trace.set('queries', len(queries))
+        try:
+            results = match_queries(queries, top_k, threshold, dlog)
+            trace.emit(200)
+            return (jsonify({"results": results}), 200, headers)
+        except Exception as e:
+            dlog(f"AI Error: {e}")
+            trace.emit(500)
+            return (jsonify({"error": "Internal AI error"}), 500, headers)
+
     try:
         keywords = request_json['keywords']
     except KeyError as e:
         dlog(f"Missing field: {e}")
-        print("\n".join(log_buffer))
+        trace.emit(400)
         return (jsonify({"error": f"Missing field: {e}"}), 400, headers)
 
     # Validation
     if not isinstance(keywords, list) or not all(isinstance(k, str) for k in keywords):
         dlog("Error: Keywords must be a list of strings")
-        print("\n".join(log_buffer))
+        trace.emit(400)
         return (jsonify({"error": "Keywords must be a list of strings"}), 400, headers)
 
     # Join list into a single phrase
@@ -79,13 +255,14 @@ def match_keywords(request):
     query_text = " ".join(keywords)
 
     try:
-        best_category = get_best_category_nlp(query_text, dlog)
+        best_category, categories = get_best_category_nlp(query_text, threshold, dlog)
         
-        # Print all logs at once
-        print("\n".join(log_buffer))
+        # One structured log entry per request
+        trace.emit(200)
         
-        return (jsonify({"category": best_category}), 200, headers)
+        # "category" stays the single best match of the whole phrase for existing clients
+        return (jsonify({"category": best_category, "categories": categories}), 200, headers)
     except Exception as e:
         dlog(f"AI Error: {e}")
-        print("\n".join(log_buffer))
+        trace.emit(500)
         return (jsonify({"error": "Internal AI error"}), 500, headers)
\ No newline at end of file
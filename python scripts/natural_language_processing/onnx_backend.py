@@ -0,0 +1,131 @@
+import os
+import sys
+
+import numpy as np
+
+from onnx_common import (
+    BACKENDS, benchmark, create_session, default_onnx_dir, export_quantized, length_sorted_batches,
+    load_tokenizer, run_cli, tokenize,
+)
+
+# --- INFERENCE BACKENDS ---
+# 'torch' : sentence-transformers + PyTorch, fp32 (original behaviour)
+# 'onnx'  : exported transformer graph run by onnxruntime on CPU, int8 dynamic
+#           quantization, tokenized with the Rust `tokenizers` package. Neither
+#           torch nor transformers is imported in this mode.
+# Session, tokenizer, export and the command line are shared with the sentiment
+# service through onnx_common.py.
+
+MAX_SEQ_LENGTH = 256
+
+# Quantized embeddings must stay this close (cosine) to the PyTorch ones
+MIN_COSINE = 0.98
+
+
+class OnnxSentenceEncoder:
+    """
+    Drop-in for the parts of SentenceTransformer the service uses:
+    encode(texts, batch_size, convert_to_numpy, normalize_embeddings).
+    Mean pooling over the attention mask, like all-MiniLM-L6-v2.
+    """
+
+    def __init__(self, onnx_dir, quantized=True, threads=None):
+        self.session, self.input_names = create_session(onnx_dir, quantized, threads)
+        # Hidden size is static in the export (only batch/sequence are dynamic)
+        self.dim = self.session.get_outputs()[0].shape[-1]
+        self.tokenizer = load_tokenizer(onnx_dir, MAX_SEQ_LENGTH)
+
+    def _embed_batch(self, texts):
+        feeds = tokenize(self.tokenizer, texts, self.input_names)
+        hidden = self.session.run(None, feeds)[0]
+        mask = feeds['attention_mask'][:, :, None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for idx in length_sorted_batches(texts, batch_size):
+            embeddings[idx] = self._embed_batch([texts[i] for i in idx])
+
+        if normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings[0] if single else embeddings
+
+
+def load_encoder(backend, model_name, onnx_dir=None):
+    """
+    Returns (encoder, index_key). index_key names the category artifact, so
+    the quantized model never reuses category vectors from the fp32 one.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {list(BACKENDS)}")
+    if backend == 'onnx':
+        return OnnxSentenceEncoder(onnx_dir or default_onnx_dir(model_name)), f"{model_name}+onnx-int8"
+
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name), model_name
+
+
+# --- EXPORT / VALIDATION / BENCHMARK (build time, needs torch) ---
+def export(model_name, onnx_dir):
+    """Exports the transformer to ONNX, then writes an int8 dynamically quantized copy."""
+    from sentence_transformers import SentenceTransformer
+
+    st_model = SentenceTransformer(model_name, device='cpu')
+    export_quantized(
+        st_model[0].auto_model, st_model.tokenizer, onnx_dir, "a sample sentence",
+        ('input_ids', 'attention_mask', 'token_type_ids'), 'last_hidden_state', {0: 'batch', 1: 'sequence'},
+    )
+
+
+def validate(model_name, onnx_dir, texts):
+    """Compares ONNX int8 embeddings and top-1 categories against PyTorch fp32."""
+    from sentence_transformers import SentenceTransformer
+
+    import category_index
+    from categories import CATEGORIES
+
+    reference = SentenceTransformer(model_name, device='cpu')
+    candidate = OnnxSentenceEncoder(onnx_dir)
+
+    ref = reference.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+    got = candidate.encode(texts, normalize_embeddings=True)
+    cosines = (ref * got).sum(axis=1)
+
+    ref_categories = category_index.encode_categories(reference, CATEGORIES)
+    got_categories = category_index.encode_categories(candidate, CATEGORIES)
+    _, ref_top = category_index.top_k(ref, ref_categories, 1)
+    _, got_top = category_index.top_k(got, got_categories, 1)
+
+    report = {
+        "texts": len(texts),
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "top1_agreement": float((ref_top[:, 0] == got_top[:, 0]).mean()),
+        "tolerance": MIN_COSINE,
+    }
+    report["ok"] = report["min_cosine"] >= MIN_COSINE
+    return report
+
+
+def bench_one(backend, model_name, onnx_dir, texts):
+    return benchmark(
+        backend, lambda: load_encoder(backend, model_name, onnx_dir)[0],
+        lambda encoder, batch, batch_size: encoder.encode(
+            batch, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True
+        ),
+        texts, batch_size=64,
+    )
+
+
+if __name__ == '__main__':
+    from categories import CATEGORIES
+
+    sample_texts = ["hungry", "coffee", "somewhere to dance", "museum and art", "quiet place to read"]
+    sample_texts += [c.replace('_', ' ') for c in CATEGORIES[::5]]
+    sys.exit(run_cli(
+        __file__, "Export, validate and benchmark the ONNX embedding backend",
+        os.environ.get('NLP_MODEL_NAME', 'all-MiniLM-L6-v2'), export, validate, bench_one, sample_texts,
+    ))
@@ -0,0 +1,125 @@
+import json
+import os
+import threading
+import time
+
+from categories import CATEGORIES, SYNONYMS
+
+# --- MATCHING VOCABULARY ---
+# What a query is matched against: one entry per phrasing, each pointing at the
+# category it stands for. Every category contributes its own name ("coffee_shop"
+# -> "coffee shop") plus its SYNONYMS; NLP_VOCABULARY_PATH can point at a JSON
+# file that adds phrasings, or whole new categories, without a redeploy:
+#
+#   {"cafe": ["flat white", "a quiet cafe to work from"], "rooftop_bar": ["rooftop drinks"]}
+#
+# The file is re-read when it changes (checked at most every NLP_VOCABULARY_CHECK_S
+# seconds); the index is rebuilt in the background and swapped in when ready.
+# A build may also return None (e.g. in a preloading gunicorn master); the index
+# is then built by the first get() of each process.
+
+
+def humanize(category):
+    return category.replace('_', ' ')
+
+
+def read_extra(path):
+    """{category: [phrases]} from the JSON file at path; {} when there is none."""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        extra = json.load(f)
+    if not isinstance(extra, dict) or not all(
+        isinstance(phrases, list) and all(isinstance(p, str) for p in phrases) for phrases in extra.values()
+    ):
+        raise ValueError(f"{path} must map category names to lists of phrases")
+    return extra
+
+
+def load_entries(path=None):
+    """
+    [(category, text)] in a stable order: built-in categories first, then the
+    categories only the file defines. Duplicate phrasings of a category are dropped.
+    """
+    extra = read_extra(path)
+    entries = []
+    for category in list(CATEGORIES) + [c for c in extra if c not in CATEGORIES]:
+        phrases = [humanize(category)] + SYNONYMS.get(category, []) + extra.get(category, [])
+        seen = set()
+        for phrase in phrases:
+            text = " ".join(phrase.split()).lower()
+            if text and text not in seen:
+                seen.add(text)
+                entries.append((category, text))
+    return entries
+
+
+def source_signature(path):
+    """Changes whenever the vocabulary file does (None: no file)."""
+    if not path:
+        return None
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class ReloadingIndex:
+    """
+    Holds the current vocabulary index. get() is cheap on the request path: it
+    only stats the file every check_s seconds, and a changed file is rebuilt on
+    a background thread while requests keep using the previous index.
+    """
+
+    def __init__(self, build, path, check_s, log=print):
+        """build(entries) -> index, or None to build on first get() instead."""
+        self.build = build
+        self.path = path
+        self.check_s = check_s
+        self.log = log
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._reloading = False
+        self.signature = source_signature(path)
+        self.index = build(load_entries(path))
+        self._checked = time.monotonic()
+
+    def get(self):
+        if self.index is None:
+            self._build_deferred()
+        if self.path and self.check_s >= 0 and time.monotonic() - self._checked >= self.check_s:
+            self._maybe_reload()
+        return self.index
+
+    def _build_deferred(self):
+        # Concurrent first requests wait for one build instead of each running it
+        with self._build_lock:
+            if self.index is None:
+                index = self.build(load_entries(self.path))
+                if index is None:
+                    raise RuntimeError("Vocabulary index build was deferred again")
+                self.index = index
+
+    def _maybe_reload(self):
+        with self._lock:
+            self._checked = time.monotonic()
+            signature = source_signature(self.path)
+            if self._reloading or signature == self.signature:
+                return
+            self._reloading = True
+        threading.Thread(target=self._reload, args=(signature,), name='vocabulary-reload', daemon=True).start()
+
+    def _reload(self, signature):
+        try:
+            index = self.build(load_entries(self.path))
+            # One reference swap: in-flight requests finish on the index they started with
+            self.index = index
+            self.log(f"Vocabulary reloaded from {self.path}: {len(index)} entries")
+        except (OSError, ValueError) as e:
+            # Keep serving the previous vocabulary until the file is fixed
+            self.log(f"Vocabulary reload failed, keeping the previous index: {e}")
+        finally:
+            with self._lock:
+                self.signature = signature
+                self._reloading = False
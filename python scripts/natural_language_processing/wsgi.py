@@ -0,0 +1,15 @@
+import gc
+import os
+
+import functions_framework
+
+# WSGI entry point for gunicorn.conf.py: importing main.py here loads the model
+# in the master process, before the workers are forked
+app = functions_framework.create_app(
+    target='match_keywords', source=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+)
+
+# Everything loaded so far lives for the whole process. Moving it out of the
+# cyclic GC's reach stops collections in the workers from touching (and so
+# copying) the shared pages.
+gc.freeze()
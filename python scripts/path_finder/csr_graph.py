@@ -0,0 +1,156 @@
+import heapq
+import os
+
+import numpy as np
+
+# --- COMPRESSED SPARSE ROW GRAPH ---
+# Nodes are renumbered 0..n-1 in ascending OSM ID order, so the ID <-> index
+# mapping is just `node_ids` (binary search one way, array lookup the other).
+# Outgoing edges of node i are targets[offsets[i]:offsets[i + 1]] with the
+# matching weights (edge 'length' in meters).
+
+ARRAYS = ('node_ids', 'lat', 'lng', 'offsets', 'targets', 'weights')
+
+
+class CSRGraph:
+    def __init__(self, node_ids, lat, lng, offsets, targets, weights):
+        self.node_ids = node_ids
+        self.lat = lat
+        self.lng = lng
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        # Where the arrays live on disk (None if never saved); derived structures
+        # such as the spatial index are persisted next to them
+        self.directory = None
+        # In-process cache of derived structures, lives as long as the graph
+        self.artifacts = {}
+
+    @property
+    def num_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def num_edges(self):
+        return len(self.targets)
+
+    @classmethod
+    def from_networkx(cls, graph):
+        """Builds the arrays from an OSMnx MultiDiGraph."""
+        node_ids = np.array(sorted(graph.nodes), dtype=np.int64)
+        lat = np.array([graph.nodes[n]['y'] for n in node_ids.tolist()], dtype=np.float64)
+        lng = np.array([graph.nodes[n]['x'] for n in node_ids.tolist()], dtype=np.float64)
+
+        edges = list(graph.edges(data='length', default=1))
+        sources = np.searchsorted(node_ids, np.array([u for u, _, _ in edges], dtype=np.int64))
+        targets = np.searchsorted(node_ids, np.array([v for _, v, _ in edges], dtype=np.int64))
+        weights = np.array([w for _, _, w in edges], dtype=np.float64)
+
+        # Group edges by source; stable so parallel edges keep their order
+        order = np.argsort(sources, kind='stable')
+        counts = np.bincount(sources, minlength=len(node_ids))
+        offsets = np.zeros(len(node_ids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        return cls(node_ids, lat, lng, offsets, targets[order].astype(np.int32), weights[order])
+
+    # --- PERSISTENCE ---
+    def save(self, directory):
+        """One .npy per array so each can be memory-mapped independently."""
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAYS:
+            tmp_path = os.path.join(directory, f"{name}.{os.getpid()}.tmp.npy")
+            np.save(tmp_path, getattr(self, name))
+            os.replace(tmp_path, os.path.join(directory, f"{name}.npy"))
+        self.directory = directory
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        mmap=True maps the arrays read-only: loading is near-instant and the
+        pages are shared through the OS page cache across worker processes.
+        """
+        mode = 'r' if mmap else None
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mode) for name in ARRAYS}
+        graph = cls(**arrays)
+        graph.directory = directory
+        return graph
+
+    @staticmethod
+    def exists(directory):
+        return all(os.path.exists(os.path.join(directory, f"{name}.npy")) for name in ARRAYS)
+
+    # --- ID MAPPING ---
+    def index_of(self, node_id):
+        i = int(np.searchsorted(self.node_ids, node_id))
+        if i >= len(self.node_ids) or self.node_ids[i] != node_id:
+            raise KeyError(node_id)
+        return i
+
+    def node_id(self, index):
+        return int(self.node_ids[index])
+
+    def edge_weight(self, u, v):
+        """Shortest u -> v edge length, or None if there is no such edge."""
+        lo, hi = self.offsets[u], self.offsets[u + 1]
+        matches = self.weights[lo:hi][self.targets[lo:hi] == v]
+        return float(matches.min()) if len(matches) else None
+
+    def coords(self, indices):
+        """[{"lat", "lng"}] for a list of node indices."""
+        idx = np.asarray(indices, dtype=np.int64)
+        return [{"lat": lat, "lng": lng} for lat, lng in zip(self.lat[idx].tolist(), self.lng[idx].tolist())]
+
+
+# --- ROUTING ON CSR ---
+def dijkstra_multi(graph, sources, targets):
+    """
+    Single search that stops once every target node is settled.
+    `sources` is a node index, or {node: initial_cost} to start from several
+    nodes at once (e.g. both ends of the edge a point was snapped onto).
+    Returns ({target: distance}, previous) where previous is the predecessor
+    tree of the explored area; use reconstruct_path per leg.
+    """
+    offsets, edge_targets, weights = graph.offsets, graph.targets, graph.weights
+    if not isinstance(sources, dict):
+        sources = {sources: 0}
+
+    # Only nodes the search actually touches get an entry
+    distances = dict(sources)
+    previous = {node: None for node in sources}
+    remaining = set(targets)
+    queue = [(cost, node) for node, cost in sources.items()]
+    heapq.heapify(queue)
+
+    while queue and remaining:
+        current_distance, current_node = heapq.heappop(queue)
+
+        if current_distance > distances[current_node]:
+            continue
+
+        remaining.discard(current_node)
+
+        lo, hi = offsets[current_node], offsets[current_node + 1]
+        for neighbor, weight in zip(edge_targets[lo:hi].tolist(), weights[lo:hi].tolist()):
+            distance = current_distance + weight
+            if distance < distances.get(neighbor, float('inf')):
+                distances[neighbor] = distance
+                previous[neighbor] = current_node
+                heapq.heappush(queue, (distance, neighbor))
+
+    return {t: distances.get(t, float('inf')) for t in targets}, previous
+
+
+def reconstruct_path(previous, end_node):
+    """Walks a predecessor tree from end_node back to the source it grew from."""
+    if end_node not in previous:
+        return []
+
+    path = []
+    current_node = end_node
+    while current_node is not None:
+        path.append(current_node)
+        current_node = previous[current_node]
+
+    path.reverse()
+    return path
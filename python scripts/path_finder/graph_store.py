@@ -0,0 +1,479 @@
+import glob
+import hashlib
+import json
+import math
+import os
+import pickle
+import shutil
+import threading
+from collections import OrderedDict
+
+import networkx as nx
+import osmnx as ox
+from osmnx._errors import InsufficientResponseError
+
+from csr_graph import CSRGraph
+
+# --- CONFIG ---
+# Walk network is cached as fixed geohash cells (same scheme as ngeohash on the TS side).
+# Precision 6 cells are ~1.2km x 0.6km, so a typical walking tour touches a handful.
+TILE_PRECISION = int(os.environ.get('ROUTE_GRAPH_TILE_PRECISION', 6))
+CACHE_DIR = os.environ.get('ROUTE_GRAPH_CACHE_DIR', '/tmp/route_finder_graphs')
+LRU_TILES = int(os.environ.get('ROUTE_GRAPH_LRU_TILES', 64))
+LRU_CSR = int(os.environ.get('ROUTE_GRAPH_LRU_CSR', 16))
+# Requests outside every seeded region get a CSR per tile set; at most this many stay on disk
+MAX_CSR_DIRS = int(os.environ.get('ROUTE_GRAPH_MAX_CSR_DIRS', 32))
+# Offline: never hit Overpass, only serve pre-seeded tiles
+OFFLINE = os.environ.get('ROUTE_GRAPH_OFFLINE', '0') == '1'
+NETWORK_TYPE = 'walk'
+
+# Bump when the on-disk tile format changes so stale tiles are ignored
+CACHE_VERSION = 1
+
+
+class GraphUnavailableError(Exception):
+    pass
+
+
+# --- GEOHASH ---
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash_encode(lat, lng, precision=TILE_PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits, bit_count, even = 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def geohash_bbox(tile):
+    """Returns (south, west, north, east) of a geohash cell."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in tile:
+        value = _BASE32.index(char)
+        for shift in range(4, -1, -1):
+            rng = lng_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (value >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lng_range[0], lat_range[1], lng_range[1]
+
+
+def tile_size(precision=TILE_PRECISION):
+    """(height, width) of a geohash cell in degrees."""
+    lng_bits = math.ceil(precision * 5 / 2)
+    lat_bits = math.floor(precision * 5 / 2)
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def tiles_for_bbox(south, west, north, east, precision=TILE_PRECISION):
+    """All geohash cells intersecting the bounding box, sorted."""
+    height, width = tile_size(precision)
+    tiles = set()
+    lat = south
+    while True:
+        lng = west
+        while True:
+            tiles.add(geohash_encode(min(lat, north), min(lng, east), precision))
+            if lng >= east:
+                break
+            lng += width
+        if lat >= north:
+            break
+        lat += height
+    return sorted(tiles)
+
+
+def bbox_from_center(center_point, dist_meters):
+    """Square bbox (south, west, north, east) of half-side dist_meters around a point."""
+    lat, lng = center_point
+    d_lat = dist_meters / 111000
+    d_lng = dist_meters / (111000 * max(math.cos(math.radians(lat)), 0.01))
+    return lat - d_lat, lng - d_lng, lat + d_lat, lng + d_lng
+
+
+# --- DISK CACHE ---
+def _tile_path(tile):
+    return os.path.join(CACHE_DIR, f"v{CACHE_VERSION}_{NETWORK_TYPE}_{tile}.pkl")
+
+
+def _read_tile(tile):
+    path = _tile_path(tile)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _write_tile(tile, graph):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _tile_path(tile)
+    data = pickle.dumps(graph, protocol=pickle.HIGHEST_PROTOCOL)
+    # Digest first: a tile on disk always has the digest of its current contents
+    _write_atomic(f"{path}.sha1", hashlib.sha1(data).hexdigest().encode())
+    # Atomic so concurrent workers never read a half-written tile
+    _write_atomic(path, data)
+
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+_digests = {}
+
+
+def tile_digest(tile):
+    """
+    SHA-1 of a cached tile's contents (None if not on disk), read from the
+    sidecar written with it and memoized per file version.
+    """
+    path = _tile_path(tile)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _digests.get(tile)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    try:
+        with open(f"{path}.sha1") as f:
+            digest = f.read().strip()
+    except FileNotFoundError:
+        # Tile written before digests existed
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+    _digests[tile] = (signature, digest)
+    return digest
+
+
+def tiles_key(tiles):
+    """Changes whenever any of the tiles is (re)written, so derived graphs never go stale."""
+    return hashlib.sha1(','.join(f"{tile}:{tile_digest(tile)}" for tile in tiles).encode()).hexdigest()[:16]
+
+
+def empty_tile_graph():
+    """Stand-in for a cell without walkable ways (river, sea, park interior)."""
+    return nx.MultiDiGraph(crs='epsg:4326')
+
+
+def _download_tile(tile):
+    south, west, north, east = geohash_bbox(tile)
+    center = ((south + north) / 2, (west + east) / 2)
+    half_side = max((north - south) * 111000, (east - west) * 111000 * math.cos(math.radians(center[0]))) / 2
+    try:
+        # retain_all/truncate_by_edge keep boundary fragments so neighbouring tiles join up
+        return ox.graph_from_point(
+            center, dist=half_side, dist_type='bbox', network_type=NETWORK_TYPE,
+            retain_all=True, truncate_by_edge=True,
+        )
+    except InsufficientResponseError:
+        # Overpass has nothing walkable here; cache the empty cell so it is not asked again
+        return empty_tile_graph()
+
+
+# --- IN-PROCESS LRU ---
+_lru = OrderedDict()
+_csr_lru = OrderedDict()
+_lru_lock = threading.Lock()
+
+
+def _lru_get(cache, key):
+    with _lru_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+
+def _lru_put(cache, key, value, max_size):
+    with _lru_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > max_size:
+            cache.popitem(last=False)
+
+
+def get_tile(tile, stats=None):
+    """Memory -> disk -> Overpass. Returns the walk graph of one cell."""
+    graph = _lru_get(_lru, tile)
+    if graph is not None:
+        if stats is not None: stats['memory_hits'] += 1
+        return graph
+
+    graph = _read_tile(tile)
+    if graph is not None:
+        if stats is not None: stats['disk_hits'] += 1
+    else:
+        if OFFLINE:
+            raise GraphUnavailableError(f"Tile {tile} is not in the offline cache ({CACHE_DIR})")
+        graph = _download_tile(tile)
+        _write_tile(tile, graph)
+        if stats is not None: stats['downloads'] += 1
+
+    _lru_put(_lru, tile, graph, LRU_TILES)
+    return graph
+
+
+def load_graph(south, west, north, east):
+    """
+    Walk graph covering the bbox, merged from cached tiles.
+    Returns (graph, stats).
+    """
+    tiles = tiles_for_bbox(south, west, north, east)
+    stats = {"tiles": len(tiles), "memory_hits": 0, "disk_hits": 0, "downloads": 0}
+
+    # Empty cells (water, parks without paths) contribute nothing to the merge
+    graphs = [graph for graph in (get_tile(tile, stats) for tile in tiles) if graph.number_of_edges()]
+    if not graphs:
+        return empty_tile_graph(), stats
+    if len(graphs) == 1:
+        return graphs[0], stats
+
+    # OSM node IDs are global, so shared boundary nodes/edges merge cleanly
+    merged = nx.compose_all(graphs)
+    merged.graph.update(graphs[0].graph)
+    return merged, stats
+
+
+# --- CSR GRAPHS ---
+# A seeded region (a city) is one CSR built at seeding time; every request whose
+# tiles all lie inside it routes on that graph, so its spatial index and
+# contraction hierarchy are built once, offline. Other requests get a CSR per
+# tile set. Both directory names carry tiles_key, so re-seeded tiles lead to a
+# fresh directory instead of a stale graph; tile-set CSRs are evicted oldest-used first.
+REGION_FILE = 'region.json'
+
+
+def _csr_dir(tiles):
+    return os.path.join(CACHE_DIR, f"v{CACHE_VERSION}_{NETWORK_TYPE}_csr_{tiles_key(tiles)}")
+
+
+def _region_dir(name, key):
+    return os.path.join(CACHE_DIR, f"v{CACHE_VERSION}_{NETWORK_TYPE}_region_{name}_{key}")
+
+
+_regions_cache = {"signature": None, "regions": []}
+
+
+def regions():
+    """[(tile set, directory)] of the seeded regions, re-read when the cache directory changes."""
+    try:
+        signature = os.stat(CACHE_DIR).st_mtime_ns
+    except FileNotFoundError:
+        return []
+    if _regions_cache["signature"] == signature:
+        return _regions_cache["regions"]
+
+    found = []
+    for path in glob.glob(os.path.join(CACHE_DIR, f"v{CACHE_VERSION}_{NETWORK_TYPE}_region_*", REGION_FILE)):
+        with open(path) as f:
+            meta = json.load(f)
+        directory = os.path.dirname(path)
+        # A region whose tiles were re-seeded since it was built is stale
+        if tiles_key(meta["tiles"]) == meta["tiles_key"] and CSRGraph.exists(directory):
+            found.append((frozenset(meta["tiles"]), directory))
+    # Smallest first, so the tightest region covering a request wins
+    found.sort(key=lambda region: len(region[0]))
+    _regions_cache.update(signature=signature, regions=found)
+    return found
+
+
+def build_region(name, tiles, graph=None, hierarchy=False):
+    """
+    Builds the CSR of a seeded area (merged from its cached tiles unless the
+    full graph is given), its spatial index and, with hierarchy=True, its
+    contraction hierarchy; then drops older builds of the same region.
+    """
+    from routing_engines import prepare_hierarchy
+    from snapping import get_spatial_index
+
+    tiles = sorted(tiles)
+    key = tiles_key(tiles)
+    directory = _region_dir(name, key)
+    if graph is None:
+        graphs = [g for g in (get_tile(tile) for tile in tiles) if g.number_of_edges()]
+        graph = nx.compose_all(graphs) if graphs else empty_tile_graph()
+    csr = CSRGraph.from_networkx(graph)
+    csr.save(directory)
+    get_spatial_index(csr)
+    if hierarchy:
+        prepare_hierarchy(csr)
+    # Written last: a region is only picked up once everything in it is ready
+    with open(os.path.join(directory, REGION_FILE), 'w') as f:
+        json.dump({"name": name, "tiles": tiles, "tiles_key": key}, f)
+
+    prefix = _region_dir(name, '')
+    for old in glob.glob(f"{prefix}*"):
+        # Exact name match: region 'city' must not remove 'city_north'
+        if old != directory and '_' not in old[len(prefix):]:
+            shutil.rmtree(old, ignore_errors=True)
+    return csr
+
+
+def _evict_csr_dirs(keep):
+    """Removes the least recently used tile-set CSR directories beyond MAX_CSR_DIRS."""
+    directories = glob.glob(os.path.join(CACHE_DIR, f"v{CACHE_VERSION}_{NETWORK_TYPE}_csr_*"))
+    if len(directories) <= MAX_CSR_DIRS:
+        return
+    directories.sort(key=lambda d: os.stat(d).st_mtime if os.path.exists(d) else 0)
+    for directory in directories[:len(directories) - MAX_CSR_DIRS]:
+        if directory != keep:
+            # Workers that already mapped the arrays keep reading them after the unlink
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def load_csr(south, west, north, east):
+    """
+    Routing graph covering the bbox as a CSRGraph: the seeded region that
+    contains it, else one for its tile set. Memory -> memory-mapped arrays
+    on disk -> built once from the merged tiles and saved.
+    Returns (csr, stats).
+    """
+    tiles = tiles_for_bbox(south, west, north, east)
+    stats = {"tiles": len(tiles), "csr": "memory"}
+
+    region = next((directory for region_tiles, directory in regions() if region_tiles.issuperset(tiles)), None)
+    graph = None
+    if region:
+        directory = region
+        stats["region"] = os.path.basename(region)
+    else:
+        # The key hashes the tiles' contents: download missing tiles before naming the directory
+        if any(tile_digest(tile) is None for tile in tiles):
+            graph, tile_stats = load_graph(south, west, north, east)
+            stats.update(tile_stats)
+        directory = _csr_dir(tiles)
+
+    csr = _lru_get(_csr_lru, directory)
+    if csr is not None:
+        return csr, stats
+
+    if CSRGraph.exists(directory):
+        csr = CSRGraph.load(directory, mmap=True)
+        # mtime doubles as "last used" for eviction
+        os.utime(directory)
+        stats["csr"] = "disk"
+    else:
+        if graph is None:
+            graph, tile_stats = load_graph(south, west, north, east)
+            stats.update(tile_stats)
+        csr = CSRGraph.from_networkx(graph)
+        csr.save(directory)
+        _evict_csr_dirs(keep=directory)
+        stats["csr"] = "built"
+
+    _lru_put(_csr_lru, directory, csr, LRU_CSR)
+    return csr, stats
+
+
+# --- OFFLINE SEEDING ---
+def split_into_tiles(graph, precision=TILE_PRECISION):
+    """
+    Cuts a city graph into geohash tiles. An edge goes to the tile of
+    both of its endpoints, matching truncate_by_edge on download. Every
+    tile inside the graph's bbox is returned, cells without edges as empty
+    graphs, so an offline cache never misses a tile the extract covers.
+    """
+    node_tile = {
+        node: geohash_encode(data['y'], data['x'], precision)
+        for node, data in graph.nodes(data=True)
+    }
+    tile_edges = {}
+    for u, v, k in graph.edges(keys=True):
+        for tile in {node_tile[u], node_tile[v]}:
+            tile_edges.setdefault(tile, []).append((u, v, k))
+
+    tiles = {}
+    if graph.number_of_nodes():
+        lats = [y for _, y in graph.nodes(data='y')]
+        lngs = [x for _, x in graph.nodes(data='x')]
+        for tile in tiles_for_bbox(min(lats), min(lngs), max(lats), max(lngs), precision):
+            empty = empty_tile_graph()
+            empty.graph.update(graph.graph)
+            tiles[tile] = empty
+    for tile, edges in tile_edges.items():
+        sub = graph.edge_subgraph(edges).copy()
+        sub.graph.update(graph.graph)
+        tiles[tile] = sub
+    return tiles
+
+
+def seed_from_graph(graph, precision=TILE_PRECISION, region=None, hierarchy=False):
+    """
+    Writes every tile of an already-built walk graph to the disk cache and,
+    given a region name, builds the region's CSR from the same graph.
+    """
+    tiles = split_into_tiles(graph, precision)
+    for tile, sub in tiles.items():
+        _write_tile(tile, sub)
+    if region:
+        build_region(region, tiles, graph, hierarchy)
+    return sorted(tiles)
+
+
+def seed_from_osm_file(filepath, precision=TILE_PRECISION, region=None, hierarchy=False):
+    """
+    Seeds the cache from a local OSM XML extract. graph_from_xml does not
+    filter by network type, so the extract should already be walk-only
+    (e.g. `osmium tags-filter city.osm.pbf w/highway -o city.osm`).
+    Pedestrians may walk one-way streets both ways, as in downloaded tiles
+    ('walk' is one of OSMnx's bidirectional network types).
+    """
+    graph = ox.graph_from_xml(filepath, bidirectional=True, retain_all=True)
+    return seed_from_graph(graph, precision, region, hierarchy)
+
+
+def seed_from_bbox(south, west, north, east, region=None, hierarchy=False):
+    """Downloads (or reuses) every tile of a bbox, e.g. to warm a city before deploy."""
+    tiles = tiles_for_bbox(south, west, north, east)
+    for tile in tiles:
+        get_tile(tile)
+    if region:
+        build_region(region, tiles, hierarchy=hierarchy)
+    return tiles
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pre-seed the path_finder walk-graph tile cache")
+    sub = parser.add_subparsers(dest='command', required=True)
+    osm = sub.add_parser('osm', help="Seed from a local OSM XML extract")
+    osm.add_argument('filepath')
+    bbox = sub.add_parser('bbox', help="Seed by downloading every tile of a bbox")
+    bbox.add_argument('south', type=float)
+    bbox.add_argument('west', type=float)
+    bbox.add_argument('north', type=float)
+    bbox.add_argument('east', type=float)
+    for command in (osm, bbox):
+        command.add_argument('--region', default='city', help="Name of the region CSR built over the seeded tiles")
+        command.add_argument('--ch', action='store_true', help="Also build the region's contraction hierarchy (engine 'ch')")
+    args = parser.parse_args()
+
+    if args.command == 'osm':
+        seeded = seed_from_osm_file(args.filepath, region=args.region, hierarchy=args.ch)
+    else:
+        seeded = seed_from_bbox(args.south, args.west, args.north, args.east, region=args.region, hierarchy=args.ch)
+    print(f"Seeded {len(seeded)} tiles and region '{args.region}' into {CACHE_DIR}")
@@ -0,0 +1,167 @@
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+# --- REQUEST INSTRUMENTATION ---
+# Same file in every service directory (each service deploys its own folder);
+# benchmarks/run_benchmarks.py fails if the copies drift apart.
+#
+# One Trace per request collects named spans (wall time, summed when a stage
+# repeats), counters and the request's log messages, and emit() prints them as
+# ONE JSON line, which Cloud Logging turns into a structured entry.
+#
+#   INSTRUMENTATION=0        spans/counters become no-ops, messages print as plain text
+#   PROFILE_SAMPLE_RATE=0.01 samples the handler's stack on 1% of requests
+#   PROFILE_INTERVAL_MS=5    sampling period of that profiler
+
+ENABLED = os.environ.get('INSTRUMENTATION', '1') != '0'
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+PROFILE_TOP_STACKS = 20
+PROFILE_MAX_DEPTH = 64
+
+# Lets library code (engines, solvers, caches) count into the active request
+_current = contextvars.ContextVar('trace', default=None)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('spans', 'name', 'started')
+
+    def __init__(self, spans, name):
+        self.spans = spans
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.spans[self.name] = self.spans.get(self.name, 0.0) + (time.perf_counter() - self.started) * 1000
+        return False
+
+
+class SamplingProfiler:
+    """
+    Background thread that records one thread's Python stack every interval.
+    Stacks are kept in collapsed form ("file:function;file:function"), ready
+    for flamegraph tools.
+    """
+
+    def __init__(self, thread_id, interval_ms=PROFILE_INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000
+        self.samples = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+                stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            if stack:
+                key = ';'.join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        top = sorted(self.samples.items(), key=lambda item: -item[1])[:PROFILE_TOP_STACKS]
+        return {
+            "interval_ms": self.interval * 1000,
+            "samples": sum(self.samples.values()),
+            "top": [{"stack": stack, "count": count} for stack, count in top],
+        }
+
+
+class Trace:
+    def __init__(self, service, prefix=''):
+        self.service = service
+        self.prefix = prefix
+        self.messages = []
+        self.spans = {}
+        self.counters = {}
+        self.started = time.perf_counter()
+        self.profiler = None
+        if ENABLED and PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+            self.profiler = SamplingProfiler(threading.get_ident()).start()
+        _current.set(self)
+
+    def log(self, msg):
+        self.messages.append(f"{self.prefix}{msg}")
+
+    # Helpers that took a list to append log lines to can take the trace instead
+    append = log
+
+    def span(self, name):
+        """Context manager timing one stage into spans[name] (ms)."""
+        return _Span(self.spans, name) if ENABLED else _NULL_SPAN
+
+    def count(self, name, n=1):
+        if ENABLED:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def set(self, name, value):
+        if ENABLED:
+            self.counters[name] = value
+
+    def emit(self, status, **fields):
+        """Prints the request's single log entry. Call once, right before returning."""
+        _current.set(None)
+        duration_ms = (time.perf_counter() - self.started) * 1000
+        if not ENABLED:
+            print("\n".join(self.messages))
+            return
+
+        entry = {
+            "severity": "ERROR" if status >= 500 else "WARNING" if status >= 400 else "INFO",
+            "message": f"{self.service} {status} in {duration_ms:.1f}ms",
+            "service": self.service,
+            "status": status,
+            "duration_ms": round(duration_ms, 2),
+            "spans": {name: round(ms, 3) for name, ms in self.spans.items()},
+            "counters": self.counters,
+            **fields,
+            "logs": self.messages,
+        }
+        if self.profiler is not None:
+            entry["profile"] = self.profiler.stop()
+        print(json.dumps(entry, default=str))
+
+
+def current():
+    return _current.get()
+
+
+def span(name):
+    """Span on the active request, if any (for code that is not handed the trace)."""
+    trace = _current.get()
+    return trace.span(name) if trace is not None else _NULL_SPAN
+
+
+def count(name, n=1):
+    """Adds to a counter of the active request, if any."""
+    trace = _current.get()
+    if trace is not None:
+        trace.count(name, n)
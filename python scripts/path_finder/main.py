@@ -1,49 +1,13 @@
 import functions_framework
-from flask import jsonify
-import osmnx as ox
-import heapq
-import itertools
+from flask import Response, jsonify
 import math
-
-# --- DIJKSTRA ALGORITHM ---
-def dijkstra(graph, start_node, end_node):
-    previous = {v: None for v in graph.keys()}
-    distances = {v: float('inf') for v in graph.keys()}
-    distances[start_node] = 0
-    queue = [(0, start_node)]
-
-    while queue:
-        current_distance, current_node = heapq.heappop(queue)
-        
-        if current_node == end_node:
-            break
-        
-        if current_distance > distances[current_node]:
-            continue
-            
-        if current_node in graph:
-            for neighbor, weight in graph[current_node]:
-                distance = current_distance + weight
-                if distance < distances[neighbor]:
-                    distances[neighbor] = distance
-                    previous[neighbor] = current_node
-                    heapq.heappush(queue, (distance, neighbor))
-
-    path = []
-    current_node = end_node
-    
-    if distances[end_node] == float('inf'):
-        return float('inf'), []
-
-    while current_node != start_node:
-        path.append(current_node)
-        current_node = previous.get(current_node)
-        if current_node is None:
-            return float('inf'), []
-            
-    path.append(start_node)
-    path.reverse()
-    return distances[end_node], path
+from tsp import solve_order, SOLVERS, EXACT_MAX_WAYPOINTS
+from orienteering import orienteer, DEFAULT_DEADLINE_MS, MAX_DEADLINE_MS, MAX_CANDIDATES, DEFAULT_WALKING_SPEED
+from routing_engines import get_engine, ENGINES
+from snapping import snap_points, along_edge_distance, SNAP_MODES
+import graph_store
+from instrumentation import Trace
+from route_output import OUTPUT_MODES, simplify, leg_payload, stitch, ndjson_lines
 
 # --- HELPER: CALCULATE CENTER & RADIUS ---
 def get_graph_center_dist(points_list):
@@ -87,16 +51,15 @@ def get_route(request):
         return ('', 204, headers)
     headers = {'Access-Control-Allow-Origin': '*'}
 
-    # Initialize Log Buffer
-    log_buffer = []
-    def dlog(msg):
-        log_buffer.append(f"[RouteFinder] {msg}")
+    # Per-request spans, counters and log lines, printed as one JSON entry
+    trace = Trace('path_finder', prefix='[RouteFinder] ')
+    dlog = trace.log
 
     # Parsing
     req = request.get_json(silent=True)
     if not req:
         dlog("Error: No JSON provided")
-        print("\n".join(log_buffer))
+        trace.emit(400)
         return (jsonify({"error": "No JSON provided"}), 400, headers)
 
     try:
@@ -108,125 +71,247 @@ def get_route(request):
         raw_waypoints = req.get('waypoints') or []
         waypoints_pts = [(w['lat'], w['lng']) for w in raw_waypoints]
         
-        dlog(f"Points: Start={start_pt}, End={end_pt}, Waypoints={len(waypoints_pts)}")
+        # TSP solver: 'auto' (default), 'exact' (Held-Karp) or 'heuristic'
+        solver = req.get('solver') or 'auto'
+        if solver not in SOLVERS:
+            raise ValueError(f"solver must be one of {list(SOLVERS)}")
+        if solver == 'exact' and len(waypoints_pts) > EXACT_MAX_WAYPOINTS:
+            raise ValueError(f"exact solver supports at most {EXACT_MAX_WAYPOINTS} waypoints")
+
+        # Snapping: 'node' (default) or 'edge'; points further than max_snap_distance (m) are rejected
+        snap_mode = req.get('snap') or 'node'
+        if snap_mode not in SNAP_MODES:
+            raise ValueError(f"snap must be one of {list(SNAP_MODES)}")
+        max_snap_distance = req.get('max_snap_distance')
+        if max_snap_distance is not None:
+            max_snap_distance = float(max_snap_distance)
+
+        # Routing engine: 'dijkstra' (default), 'astar' (bidirectional A*) or 'ch' (contraction hierarchies)
+        engine_name = req.get('engine') or 'dijkstra'
+        if engine_name not in ENGINES:
+            raise ValueError(f"engine must be one of {list(ENGINES)}")
+
+        # Output: 'coords' (default), 'polyline' (per-leg encoded polylines) or 'ndjson' (streamed legs);
+        # simplify_tolerance (m) applies Douglas-Peucker to every leg in any mode
+        output = req.get('output') or 'coords'
+        if output not in OUTPUT_MODES:
+            raise ValueError(f"output must be one of {list(OUTPUT_MODES)}")
+        simplify_tolerance = float(req.get('simplify_tolerance') or 0)
+        if simplify_tolerance < 0:
+            raise ValueError("simplify_tolerance must be >= 0")
+
+        # Orienteering: with max_distance (m) and/or max_duration (s, at walking_speed m/s) the
+        # waypoints are scored candidates ('score', default 1) and only the best-scoring subset
+        # that fits the budget is visited; deadline_ms bounds the solver's search time
+        budget = None
+        if req.get('max_distance') is not None or req.get('max_duration') is not None:
+            if solver != 'auto':
+                raise ValueError("solver does not apply with max_distance / max_duration")
+            if len(waypoints_pts) > MAX_CANDIDATES:
+                raise ValueError(f"at most {MAX_CANDIDATES} candidate waypoints with a budget")
+            limits = []
+            if req.get('max_distance') is not None:
+                limits.append(float(req['max_distance']))
+            if req.get('max_duration') is not None:
+                walking_speed = float(req.get('walking_speed') or DEFAULT_WALKING_SPEED)
+                if walking_speed <= 0:
+                    raise ValueError("walking_speed must be > 0")
+                limits.append(float(req['max_duration']) * walking_speed)
+            budget = min(limits)
+            if budget < 0:
+                raise ValueError("max_distance and max_duration must be >= 0")
+            scores = [float(w.get('score', 1)) for w in raw_waypoints]
+            if any(score < 0 for score in scores):
+                raise ValueError("waypoint scores must be >= 0")
+            deadline_ms = min(float(req.get('deadline_ms') or DEFAULT_DEADLINE_MS), MAX_DEADLINE_MS)
+
+        dlog(f"Points: Start={start_pt}, End={end_pt}, Waypoints={len(waypoints_pts)}, Solver={solver}, Snap={snap_mode}, Engine={engine_name}, Output={output}, Budget={budget}")
         
     except Exception as e:
         dlog(f"Parsing error: {e}")
-        print("\n".join(log_buffer))
+        trace.emit(400)
         return (jsonify({"error": f"Data parsing error: {str(e)}"}), 400, headers)
 
     # Graph Generation
     all_points = [start_pt, end_pt] + waypoints_pts
     center_point, dist_meters = get_graph_center_dist(all_points)
     
-    dlog(f"Downloading Graph. Center={center_point}, Dist={dist_meters}m")
+    dlog(f"Loading Graph. Center={center_point}, Dist={dist_meters}m")
 
     try:
-        # Use graph_from_point (safer than bbox)
-        # dist_type='bbox' creates a square bounding box around the point
-        plot = ox.graph_from_point(center_point, dist=dist_meters, dist_type='bbox', network_type="walk")
-        dlog(f"Graph downloaded. Nodes: {len(plot.nodes)}, Edges: {len(plot.edges)}")
+        # CSR graph of the cached geohash tiles covering the bbox (memory-mapped when on disk)
+        bbox = graph_store.bbox_from_center(center_point, dist_meters)
+        with trace.span('graph_load'):
+            graph, graph_stats = graph_store.load_csr(*bbox)
+        dlog(f"Graph loaded. Nodes: {graph.num_nodes}, Edges: {graph.num_edges}, Store: {graph_stats}")
+        trace.set('graph_nodes', graph.num_nodes)
+        trace.set('graph_edges', graph.num_edges)
+        trace.set('graph_source', graph_stats['csr'])
+        for stat in ('tiles', 'memory_hits', 'disk_hits', 'downloads'):
+            if stat in graph_stats:
+                trace.count(f"graph_{stat}", graph_stats[stat])
+        # CH is only preprocessed offline (graph_store.py --ch); without it 'ch' runs Dijkstra
+        with trace.span('engine_prepare'):
+            engine = get_engine(engine_name, graph)
+        if engine.name != engine_name:
+            dlog(f"No prebuilt contraction hierarchy for this graph, routing with {engine.name}")
     except Exception as e:
-        dlog(f"OSMnx error: {e}")
-        print("\n".join(log_buffer))
+        dlog(f"Graph store error: {e}")
+        trace.emit(500)
         return (jsonify({"error": f"Graph generation failed: {str(e)}"}), 500, headers)
 
-    # Find Nodes
-    points_map = {}
-    points_map['start'] = ox.nearest_nodes(plot, start_pt[1], start_pt[0])
-    points_map['end'] = ox.nearest_nodes(plot, end_pt[1], end_pt[0])
-    
-    for i, pt in enumerate(waypoints_pts):
-        points_map[i] = ox.nearest_nodes(plot, pt[1], pt[0])
+    # Areas made only of empty tiles (water, parks without paths) have nothing to snap onto
+    if graph.num_nodes == 0:
+        dlog("No walkable paths in the requested area")
+        trace.emit(404)
+        return (jsonify({"error": "No walkable paths in the requested area"}), 404, headers)
 
-    # Build Adjacency List for Dijkstra
-    adj_list = {}
-    for u, v, data in plot.edges(data=True):
-        weight = data.get('length', 1)
-        if u not in adj_list: adj_list[u] = []
-        adj_list[u].append((v, weight))
+    # Snap all points in one batched spatial-index query
+    keys = ['start', 'end'] + list(range(len(waypoints_pts)))
+    with trace.span('snap'):
+        snaps = dict(zip(keys, snap_points(graph, [start_pt, end_pt] + waypoints_pts, snap_mode)))
+    snap_report = {
+        "start": round(snaps['start']['distance'], 1),
+        "end": round(snaps['end']['distance'], 1),
+        "waypoints": [round(snaps[i]['distance'], 1) for i in range(len(waypoints_pts))],
+    }
+    dlog(f"Snap distances (m): {snap_report}")
+
+    if max_snap_distance is not None:
+        too_far = [str(k) for k in keys if snaps[k]['distance'] > max_snap_distance]
+        if too_far:
+            dlog(f"Points too far from walk network: {too_far}")
+            trace.emit(400)
+            return (jsonify({
+                "error": f"Points further than {max_snap_distance}m from a walkable path: {too_far}",
+                "snap_distances": snap_report
+            }), 400, headers)
 
     # Distance Matrix & TSP
-    path_matrix = {}
-    keys = ['start', 'end'] + list(range(len(waypoints_pts)))
+    # One search per source; paths are only rebuilt for legs the tour uses
+    distance_matrix = {}
+    leg_ends = {}
+    search_trees = {}
     sources = ['start'] + list(range(len(waypoints_pts)))
     targets = ['end'] + list(range(len(waypoints_pts)))
     
     dlog("Calculating Distance Matrix...")
     
-    for src in sources:
-        for tgt in targets:
-            if src == tgt: continue 
-            
-            start_node = points_map[src]
-            end_node = points_map[tgt]
-            
-            try:
-                dist, path = dijkstra(adj_list, start_node, end_node)
-                path_matrix[(src, tgt)] = (dist, path)
-            except Exception:
-                path_matrix[(src, tgt)] = (float('inf'), [])
-
-    # Permutations
-    waypoint_indices = list(range(len(waypoints_pts)))
-    permutations = list(itertools.permutations(waypoint_indices))
-    
-    best_distance = float('inf')
-    best_order = [] 
-    
-    if not waypoint_indices:
-        dist, path = path_matrix.get(('start', 'end'), (float('inf'), []))
-        if dist != float('inf'):
-            best_distance = dist
-            best_order = ['start', 'end']
+    with trace.span('distance_matrix'):
+        for src in sources:
+            target_nodes = set()
+            for tgt in targets:
+                if tgt != src: target_nodes.update(snaps[tgt]['targets'])
+
+            node_distances, tree = engine.one_to_many(snaps[src]['sources'], target_nodes)
+            search_trees[src] = tree
+
+            for tgt in targets:
+                if src == tgt: continue
+                # Arrive through whichever end of the snapped edge is cheaper
+                best_node, best_dist = None, float('inf')
+                for node, extra in snaps[tgt]['targets'].items():
+                    if node_distances[node] + extra < best_dist:
+                        best_node, best_dist = node, node_distances[node] + extra
+                # Two points on the same edge: walking straight along it may beat any search path
+                direct = along_edge_distance(graph, snaps[src], snaps[tgt])
+                if direct is not None and direct <= best_dist:
+                    best_node, best_dist = None, direct
+                distance_matrix[(src, tgt)] = best_dist
+                leg_ends[(src, tgt)] = best_node
+
+    # Order Waypoints (Held-Karp or heuristic)
+    n = len(waypoints_pts)
+    matrix_keys = ['start'] + list(range(n)) + ['end']
+    dist_matrix = [
+        [0 if u == v else distance_matrix.get((u, v), float('inf')) for v in matrix_keys]
+        for u in matrix_keys
+    ]
+
+    if budget is None:
+        with trace.span('tsp'):
+            best_distance, best_sequence, solver_info = solve_order(dist_matrix, n, solver)
+        dlog(f"Solver: {solver_info['name']} | Distance: {best_distance} | Gap: {solver_info['gap']}")
     else:
-        for perm in permutations:
-            current_dist = 0
-            sequence = ['start'] + list(perm) + ['end']
-            valid_perm = True
-            for i in range(len(sequence) - 1):
-                u, v = sequence[i], sequence[i+1]
-                d, _ = path_matrix.get((u, v), (float('inf'), []))
-                if d == float('inf'):
-                    valid_perm = False
-                    break
-                current_dist += d
-            
-            if valid_perm and current_dist < best_distance:
-                best_distance = current_dist
-                best_order = sequence
+        # Orienteering: pick and order the subset of waypoints that fits the budget
+        with trace.span('orienteering'):
+            best_distance, best_sequence, solver_info = orienteer(dist_matrix, n, scores, budget, deadline_ms)
+        dlog(f"Solver: {solver_info['name']} | Distance: {best_distance} | Score: {solver_info['score']}/{solver_info['score_upper_bound']} | Deadline hit: {solver_info['deadline_hit']}")
+        if best_distance == float('inf'):
+            dlog("Start and end alone exceed the budget")
+            trace.emit(404)
+            return (jsonify({
+                "error": f"No route fits within {budget}m: start to end alone is {distance_matrix[('start', 'end')]}m"
+            }), 404, headers)
+        # Waypoint indices, so the plain 'coords' output (which has no order) still tells what was picked
+        solver_info["visits"] = [i - 1 for i in best_sequence[1:-1]]
+        solver_info["skipped"] = [i for i in range(n) if i + 1 not in best_sequence]
+
+    best_order = [matrix_keys[i] for i in best_sequence]
 
     if best_distance == float('inf'):
         dlog("No path found")
-        print("\n".join(log_buffer))
+        trace.emit(404)
         return (jsonify({"error": "No valid route found"}), 404, headers)
 
-    # Stitching
-    full_node_path = []
-    for i in range(len(best_order) - 1):
+    # Stitching & Convert to Coords, one leg per consecutive pair of best_order
+    def leg_coords(i):
         u, v = best_order[i], best_order[i+1]
-        _, segment_path = path_matrix[(u, v)]
-        if i > 0:
-            full_node_path.extend(segment_path[1:])
-        else:
-            full_node_path.extend(segment_path)
-
-    # Convert to Coords
-    route_coords = []
-    for node_id in full_node_path:
-        if node_id in plot.nodes:
-            node_data = plot.nodes[node_id]
-            route_coords.append({
-                "lat": node_data['y'], 
-                "lng": node_data['x']
-            })
+        if leg_ends[(u, v)] is None:
+            # Along-edge leg: the straight segment between the two split points
+            coords = [{"lat": snaps[u]['lat'], "lng": snaps[u]['lng']}, {"lat": snaps[v]['lat'], "lng": snaps[v]['lng']}]
+            return simplify(coords, simplify_tolerance)
+        coords = graph.coords(engine.path(search_trees[u], leg_ends[(u, v)]))
+        # Legs start and end on the split points of edge snaps, not on the nearest node
+        # (a point that fell back to a node snap already is the path's end node)
+        if snaps[u]['edge'] is not None:
+            coords = [{"lat": snaps[u]['lat'], "lng": snaps[u]['lng']}] + coords
+        if snaps[v]['edge'] is not None:
+            coords.append({"lat": snaps[v]['lat'], "lng": snaps[v]['lng']})
+        return simplify(coords, simplify_tolerance)
+
+    def legs():
+        for i in range(len(best_order) - 1):
+            u, v = best_order[i], best_order[i+1]
+            yield leg_payload(i, u, v, distance_matrix[(u, v)], leg_coords(i))
+
+    summary = {
+        "distance": best_distance,
+        "order": best_order,
+        "solver": solver_info,
+        "engine": engine.name,
+        "snap_distances": snap_report
+    }
+
+    if output == 'ndjson':
+        def stream():
+            # Each leg's path is rebuilt and encoded only when it is written out
+            with trace.span('stream'):
+                yield from ndjson_lines({**summary, "legs": len(best_order) - 1}, legs())
+            dlog(f"Streamed {len(best_order) - 1} legs")
+            trace.emit(200)
+        return Response(stream(), 200, headers, mimetype='application/x-ndjson')
+
+    if output == 'polyline':
+        with trace.span('stitch'):
+            leg_list = list(legs())
+        dlog(f"Returning {len(leg_list)} legs with {sum(leg['points'] for leg in leg_list)} points")
+        trace.emit(200)
+        return (jsonify({**summary, "legs": leg_list}), 200, headers)
+
+    with trace.span('stitch'):
+        route_coords = stitch([leg_coords(i) for i in range(len(best_order) - 1)])
+    trace.set('route_points', len(route_coords))
 
     dlog(f"Returning route with {len(route_coords)} points")
     
-    # Print all logs at once
-    print("\n".join(log_buffer))
+    # One structured log entry per request
+    trace.emit(200)
     
     return (jsonify({
         "distance": best_distance,
-        "route": route_coords
-    }), 200, headers)
\ No newline at end of file
+        "route": route_coords,
+        "solver": solver_info,
+        "engine": engine.name,
+        "snap_distances": snap_report
+    }), 200, headers)
@@ -0,0 +1,232 @@
+import random
+import time
+
+from instrumentation import count
+from tsp import INF, _UNREACHABLE, _EPS, path_cost, two_opt, or_opt
+
+# --- ORIENTEERING ---
+# Same matrix layout as tsp.py (0 = start, 1..n = candidates, n + 1 = end), but
+# instead of visiting every waypoint the solver picks the subset with the
+# highest total score whose walk fits in `budget` meters, and orders it.
+#
+#   1. Greedy insertion: repeatedly insert the candidate with the best
+#      score / extra-distance ratio at its cheapest position, while it fits.
+#   2. Iterated local search: shorten the tour with 2-opt / Or-opt, spend the
+#      freed budget on more insertions and on swapping visits for better-scoring
+#      candidates, then perturb (drop a few visits) and repeat, keeping the best
+#      (score, -distance) seen.
+# The initial greedy tour is always completed; the search after it stops after
+# STALE_ROUNDS rounds without improvement or at the deadline, whichever comes
+# first, and the best tour so far is returned.
+
+DEFAULT_DEADLINE_MS = 200
+MAX_DEADLINE_MS = 5000
+MAX_CANDIDATES = 100
+# Turns max_duration (s) into a distance budget when no walking_speed is given (~5 km/h)
+DEFAULT_WALKING_SPEED = 1.4
+# Rounds in a row without a better tour before the search gives up early
+STALE_ROUNDS = 30
+# Share of the visits dropped by one perturbation
+PERTURB_SHARE = 0.2
+# Fixed seed: the same request always explores the same perturbations
+SEED = 7
+
+
+class _Deadline:
+    def __init__(self, deadline_ms):
+        self.at = time.perf_counter() + deadline_ms / 1000
+        self.hit = False
+
+    def expired(self):
+        if not self.hit and time.perf_counter() >= self.at:
+            self.hit = True
+        return self.hit
+
+
+def _cheapest_insertion(dist, route, v):
+    """(extra distance, index in route) of the best place to insert v."""
+    best_delta, best_pos = INF, -1
+    for p in range(len(route) - 1):
+        a, b = route[p], route[p + 1]
+        delta = dist[a][v] + dist[v][b] - dist[a][b]
+        if delta < best_delta:
+            best_delta, best_pos = delta, p + 1
+    return best_delta, best_pos
+
+
+def greedy_insert(dist, route, length, unvisited, scores, budget, deadline):
+    """
+    Inserts candidates by best score per extra meter until none fits.
+    Each candidate's cheapest insertion is cached with the edge it splits; after
+    an insertion only candidates whose edge was split need a full rescan, the
+    rest just compare against the two new edges. Returns the new route length.
+    deadline=None runs to completion.
+    """
+    best = {}
+    for v in unvisited:
+        delta, pos = _cheapest_insertion(dist, route, v)
+        best[v] = (delta, route[pos - 1], route[pos])
+
+    while best and not (deadline is not None and deadline.expired()):
+        pick = None
+        for v, (delta, _, _) in best.items():
+            if length + delta > budget + _EPS:
+                continue
+            key = (scores[v] / max(delta, _EPS), scores[v], -v)
+            if pick is None or key > pick[0]:
+                pick = (key, v)
+        if pick is None:
+            break
+
+        v = pick[1]
+        delta, a, b = best.pop(v)
+        route.insert(route.index(a) + 1, v)
+        unvisited.discard(v)
+        length += delta
+        count('orienteering_insertions')
+
+        for u, (u_delta, ua, ub) in best.items():
+            if (ua, ub) == (a, b):
+                u_delta, pos = _cheapest_insertion(dist, route, u)
+                best[u] = (u_delta, route[pos - 1], route[pos])
+                continue
+            for x, y in ((a, v), (v, b)):
+                d = dist[x][u] + dist[u][y] - dist[x][y]
+                if d < u_delta:
+                    u_delta = d
+                    best[u] = (d, x, y)
+    return length
+
+
+def replace_visits(dist, route, length, unvisited, scores, budget, deadline):
+    """
+    Swaps a visit for an unvisited candidate with a higher score when the
+    candidate fits in the gap the visit leaves. Returns the new route length.
+    """
+    improved = True
+    while improved and not deadline.expired():
+        improved = False
+        for i in range(1, len(route) - 1):
+            if deadline.expired():
+                break
+            v = route[i]
+            a, b = route[i - 1], route[i + 1]
+            without = route[:i] + route[i + 1:]
+            freed = length - (dist[a][v] + dist[v][b] - dist[a][b])
+            for u in sorted(unvisited, key=lambda u: -scores[u]):
+                if scores[u] <= scores[v] + _EPS:
+                    break
+                delta, pos = _cheapest_insertion(dist, without, u)
+                if freed + delta <= budget + _EPS:
+                    without.insert(pos, u)
+                    route[:] = without
+                    unvisited.discard(u)
+                    unvisited.add(v)
+                    length = freed + delta
+                    improved = True
+                    count('orienteering_replacements')
+                    break
+            if improved:
+                break
+    return length
+
+
+def _perturb(dist, route, scores, rng):
+    """Drops a few visits, preferring those with little score for the distance they cost. Returns them."""
+    visits = route[1:-1]
+    drop = max(1, int(len(visits) * PERTURB_SHARE))
+    keys = []
+    for i, v in enumerate(visits, start=1):
+        a, b = route[i - 1], route[i + 1]
+        saving = dist[a][v] + dist[v][b] - dist[a][b]
+        weight = max(saving, _EPS) / max(scores[v], _EPS)
+        # Weighted sampling without replacement (Efraimidis-Spirakis keys)
+        keys.append((rng.random() ** (1 / weight), v))
+    dropped = {v for _, v in sorted(keys, reverse=True)[:drop]}
+    route[:] = [v for v in route if v not in dropped]
+    return dropped
+
+
+def orienteer(dist, n, scores, budget, deadline_ms=DEFAULT_DEADLINE_MS):
+    """
+    Chooses and orders a subset of the n candidates between start and end.
+    scores[i] is the score of candidate i (matrix index i + 1).
+    Returns (distance, sequence, info); distance is inf when even the direct
+    start -> end walk exceeds the budget.
+    """
+    started = time.perf_counter()
+    deadline = _Deadline(deadline_ms)
+    end = n + 1
+    score_of = [0.0] + list(scores) + [0.0]
+    local = [[d if d != INF else _UNREACHABLE for d in row] for row in dist]
+
+    # Candidates worth nothing, or out of reach even on their own, never enter a tour
+    reachable = {
+        v for v in range(1, n + 1)
+        if score_of[v] > 0 and local[0][v] + local[v][end] <= budget + _EPS
+    }
+    info = {
+        "name": "greedy_insertion_ils",
+        "candidates": n,
+        "budget": budget,
+        "optimal": False,
+        # No tour can collect more than every individually reachable candidate
+        "score_upper_bound": sum(score_of[v] for v in reachable),
+    }
+
+    if local[0][end] > budget + _EPS:
+        info.update(score=0.0, selected=0, rounds=0, deadline_hit=False,
+                    time_ms=round((time.perf_counter() - started) * 1000, 3))
+        return INF, [], info
+
+    route = [0, end]
+    unvisited = set(reachable)
+    length = greedy_insert(local, route, local[0][end], unvisited, score_of, budget, None)
+
+    def objective(r, l):
+        return (sum(score_of[v] for v in r), -l)
+
+    best_route, best_length = list(route), length
+    best_value = objective(route, length)
+    rng = random.Random(SEED)
+    rounds = stale = 0
+
+    while unvisited and stale < STALE_ROUNDS and not deadline.expired():
+        rounds += 1
+        count('orienteering_rounds')
+        # Shorten what is visited, then spend the freed budget
+        if len(route) > 3:
+            two_opt(local, route, stop=deadline.expired)
+            or_opt(local, route, stop=deadline.expired)
+        length = path_cost(local, route)
+        length = greedy_insert(local, route, length, unvisited, score_of, budget, deadline)
+        length = replace_visits(local, route, length, unvisited, score_of, budget, deadline)
+        length = greedy_insert(local, route, length, unvisited, score_of, budget, deadline)
+
+        value = objective(route, length)
+        if value[0] > best_value[0] + _EPS or (value[0] >= best_value[0] - _EPS and value[1] > best_value[1] + _EPS):
+            best_route, best_length, best_value = list(route), length, value
+            stale = 0
+        else:
+            # Continue from the best tour rather than drifting away from it
+            route, length = list(best_route), best_length
+            unvisited = reachable - set(route)
+            stale += 1
+
+        if len(route) > 2:
+            unvisited |= _perturb(local, route, score_of, rng)
+            length = path_cost(local, route)
+
+    # A final polish of the best tour only ever shortens it
+    if len(best_route) > 3 and not deadline.expired():
+        two_opt(local, best_route, stop=deadline.expired)
+        or_opt(local, best_route, stop=deadline.expired)
+
+    info.update(
+        score=best_value[0],
+        selected=len(best_route) - 2,
+        rounds=rounds,
+        deadline_hit=deadline.hit,
+        time_ms=round((time.perf_counter() - started) * 1000, 3),
+    )
+    return path_cost(dist, best_route), best_route, info
@@ -0,0 +1,127 @@
+import json
+import math
+
+EARTH_RADIUS_M = 6371000
+# 'coords'  : one {"lat", "lng"} dict per node for the whole route (original format)
+# 'polyline': per-leg Google encoded polylines, in tour order
+# 'ndjson'  : same legs streamed one JSON line each after a summary line
+OUTPUT_MODES = ('coords', 'polyline', 'ndjson')
+POLYLINE_PRECISION = 5
+
+
+# --- ENCODED POLYLINE ---
+def _encode_value(value):
+    value = ~(value << 1) if value < 0 else value << 1
+    chunks = []
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+
+def encode_polyline(coords, precision=POLYLINE_PRECISION):
+    """Google encoded polyline of a list of {"lat", "lng"} dicts."""
+    factor = 10 ** precision
+    parts = []
+    prev_lat = prev_lng = 0
+    for point in coords:
+        lat = int(round(point['lat'] * factor))
+        lng = int(round(point['lng'] * factor))
+        parts.append(_encode_value(lat - prev_lat))
+        parts.append(_encode_value(lng - prev_lng))
+        prev_lat, prev_lng = lat, lng
+    return ''.join(parts)
+
+
+def decode_polyline(encoded, precision=POLYLINE_PRECISION):
+    factor = 10 ** precision
+    coords = []
+    index = lat = lng = 0
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        coords.append({"lat": lat / factor, "lng": lng / factor})
+    return coords
+
+
+# --- SIMPLIFICATION ---
+def simplify(coords, tolerance):
+    """
+    Douglas-Peucker on a local equirectangular projection: keeps the end points
+    and drops every point closer than `tolerance` meters to the simplified line.
+    """
+    if tolerance <= 0 or len(coords) < 3:
+        return coords
+
+    cos_ref = math.cos(math.radians(coords[0]['lat']))
+    xy = [
+        (math.radians(p['lng']) * EARTH_RADIUS_M * cos_ref, math.radians(p['lat']) * EARTH_RADIUS_M)
+        for p in coords
+    ]
+
+    keep = [False] * len(coords)
+    keep[0] = keep[-1] = True
+    # Explicit stack: long tours would exceed the recursion limit
+    stack = [(0, len(coords) - 1)]
+    while stack:
+        first, last = stack.pop()
+        ax, ay = xy[first]
+        dx, dy = xy[last][0] - ax, xy[last][1] - ay
+        length_sq = dx * dx + dy * dy
+
+        best, best_dist = None, tolerance
+        for i in range(first + 1, last):
+            px, py = xy[i][0] - ax, xy[i][1] - ay
+            if length_sq > 0:
+                t = max(0.0, min(1.0, (px * dx + py * dy) / length_sq))
+                dist = math.hypot(px - t * dx, py - t * dy)
+            else:
+                dist = math.hypot(px, py)
+            if dist > best_dist:
+                best, best_dist = i, dist
+
+        if best is not None:
+            keep[best] = True
+            stack.append((first, best))
+            stack.append((best, last))
+
+    return [p for p, kept in zip(coords, keep) if kept]
+
+
+# --- LEGS ---
+def leg_payload(index, origin, destination, distance, coords):
+    return {
+        "index": index,
+        "from": origin,
+        "to": destination,
+        "distance": distance,
+        "points": len(coords),
+        "polyline": encode_polyline(coords),
+    }
+
+
+def stitch(legs):
+    """Whole-route coordinate list from per-leg lists sharing their end points."""
+    route = []
+    for i, coords in enumerate(legs):
+        route.extend(coords if i == 0 else coords[1:])
+    return route
+
+
+def ndjson_lines(summary, legs):
+    """Summary line first, then one line per leg as it is produced."""
+    yield json.dumps({"type": "summary", **summary}) + "\n"
+    for leg in legs:
+        yield json.dumps({"type": "leg", **leg}) + "\n"
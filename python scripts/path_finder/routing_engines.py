@@ -0,0 +1,529 @@
+import heapq
+import math
+import os
+
+import numpy as np
+
+from csr_graph import dijkstra_multi, reconstruct_path
+from instrumentation import count
+
+EARTH_RADIUS_M = 6371000
+INF = float('inf')
+
+# Every engine answers the same two questions for get_route:
+#   one_to_many(sources, targets) -> ({target: distance}, tree)
+#       sources is {node: initial_cost}, targets a set of node indices
+#   path(tree, target) -> [node indices] from the seed the leg left from to target
+# so the distance matrix and stitching code never care which engine ran.
+
+
+# --- DIJKSTRA ---
+class DijkstraEngine:
+    name = 'dijkstra'
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def one_to_many(self, sources, targets):
+        distances, previous = dijkstra_multi(self.graph, sources, targets)
+        # Nodes labelled by the search: the work it did, without a per-pop counter
+        count('search_nodes', len(previous))
+        return distances, previous
+
+    def path(self, tree, target):
+        return reconstruct_path(tree, target)
+
+
+# --- BIDIRECTIONAL A* ---
+def reverse_csr(graph):
+    """(offsets, targets, weights) of the reversed graph, cached per graph."""
+    reverse = graph.artifacts.get('reverse_csr')
+    if reverse is None:
+        n = graph.num_nodes
+        sources = np.repeat(np.arange(n, dtype=np.int32), np.diff(graph.offsets))
+        order = np.argsort(graph.targets, kind='stable')
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(graph.targets, minlength=n), out=offsets[1:])
+        reverse = (offsets, sources[order], np.asarray(graph.weights)[order])
+        graph.artifacts['reverse_csr'] = reverse
+    return reverse
+
+
+def _haversine(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+class BidirectionalAStarEngine:
+    """
+    Bidirectional A* with the average of the forward and backward great-circle
+    potentials, so both searches see the same consistent reduced costs and can
+    stop as soon as their top keys add up to the best meeting distance.
+    Great-circle distance never exceeds an edge's 'length', so results are exact.
+    Meant for single legs: goal direction only helps with one target, so a
+    search with several targets (the distance matrix) runs one multi-target
+    Dijkstra instead of a bidirectional search per target.
+    """
+    name = 'astar'
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.reverse = reverse_csr(graph)
+
+    def _coords(self, node):
+        return float(self.graph.lat[node]), float(self.graph.lng[node])
+
+    def _search(self, sources, target):
+        graph = self.graph
+        source_coords = [(self._coords(s), cost) for s, cost in sources.items()]
+        target_lat, target_lng = self._coords(target)
+        potentials = {}
+
+        def potential(v):
+            p = potentials.get(v)
+            if p is None:
+                lat, lng = self._coords(v)
+                to_target = _haversine(lat, lng, target_lat, target_lng)
+                from_source = min(cost + _haversine(s_lat, s_lng, lat, lng) for (s_lat, s_lng), cost in source_coords)
+                p = potentials[v] = (to_target - from_source) / 2
+            return p
+
+        dist_f = dict(sources)
+        dist_r = {target: 0}
+        prev_f = {s: None for s in sources}
+        next_r = {target: None}
+        queue_f = [(cost + potential(s), cost, s) for s, cost in sources.items()]
+        queue_r = [(-potential(target), 0, target)]
+        heapq.heapify(queue_f)
+
+        best, meet = INF, None
+        if target in dist_f:
+            best, meet = dist_f[target], target
+
+        sides = (
+            (queue_f, dist_f, prev_f, dist_r, (graph.offsets, graph.targets, graph.weights), 1),
+            (queue_r, dist_r, next_r, dist_f, self.reverse, -1),
+        )
+
+        while queue_f and queue_r:
+            if queue_f[0][0] + queue_r[0][0] >= best:
+                break
+
+            side = sides[0] if queue_f[0][0] <= queue_r[0][0] else sides[1]
+            queue, dist, parent, other_dist, (offsets, targets, weights), sign = side
+
+            _, current_distance, current_node = heapq.heappop(queue)
+            if current_distance > dist[current_node]:
+                continue
+
+            lo, hi = offsets[current_node], offsets[current_node + 1]
+            for neighbor, weight in zip(targets[lo:hi].tolist(), weights[lo:hi].tolist()):
+                distance = current_distance + weight
+                if distance < dist.get(neighbor, INF):
+                    dist[neighbor] = distance
+                    parent[neighbor] = current_node
+                    heapq.heappush(queue, (distance + sign * potential(neighbor), distance, neighbor))
+                    if neighbor in other_dist and distance + other_dist[neighbor] < best:
+                        best, meet = distance + other_dist[neighbor], neighbor
+
+        count('search_nodes', len(prev_f) + len(next_r))
+        return best, (meet, prev_f, next_r)
+
+    def one_to_many(self, sources, targets):
+        if len(targets) != 1:
+            distances, previous = dijkstra_multi(self.graph, sources, targets)
+            count('search_nodes', len(previous))
+            return distances, ('dijkstra', previous)
+        (target,) = targets
+        distance, search = self._search(sources, target)
+        return {target: distance}, ('astar', search)
+
+    def path(self, tree, target):
+        kind, search = tree
+        if kind == 'dijkstra':
+            return reconstruct_path(search, target)
+        meet, prev_f, next_r = search
+        if meet is None:
+            return []
+        path = reconstruct_path(prev_f, meet)
+        node = next_r[meet]
+        while node is not None:
+            path.append(node)
+            node = next_r[node]
+        return path
+
+
+# --- CONTRACTION HIERARCHIES ---
+CH_ARRAYS = (
+    'rank',
+    'up_offsets', 'up_targets', 'up_weights', 'up_via',
+    'down_offsets', 'down_targets', 'down_weights', 'down_via',
+)
+# Witness searches give up after settling this many nodes (may add extra shortcuts, never wrong ones)
+WITNESS_SETTLE_LIMIT = 60
+
+
+class ContractionHierarchy:
+    """
+    Node ranks plus two CSR graphs: 'up' holds u -> w edges with rank[w] > rank[u],
+    'down' holds, at node x, the edges y -> x with rank[y] > rank[x] (stored x -> y).
+    via[e] is the contracted middle node of a shortcut, or -1 for an original edge.
+    """
+
+    def __init__(self, **arrays):
+        for name in CH_ARRAYS:
+            setattr(self, name, arrays[name])
+
+    def save(self, directory):
+        for name in CH_ARRAYS:
+            tmp_path = os.path.join(directory, f"ch_{name}.{os.getpid()}.tmp.npy")
+            np.save(tmp_path, getattr(self, name))
+            os.replace(tmp_path, os.path.join(directory, f"ch_{name}.npy"))
+
+    @classmethod
+    def load(cls, directory):
+        # Plain ndarray views of the mappings: slicing an np.memmap costs ~10us
+        # per call, which dominated the per-node work of the upward searches
+        return cls(**{
+            name: np.asarray(np.load(os.path.join(directory, f"ch_{name}.npy"), mmap_mode='r')) for name in CH_ARRAYS
+        })
+
+    @staticmethod
+    def exists(directory):
+        return all(os.path.exists(os.path.join(directory, f"ch_{name}.npy")) for name in CH_ARRAYS)
+
+    def shortcut_via(self):
+        """{(a, b): middle node} of every shortcut, built once; path unpacking looks edges up here."""
+        via = getattr(self, '_shortcut_via', None)
+        if via is None:
+            via = {}
+            # 'up' stores a -> b at a; 'down' stores b -> a at a
+            for offsets, targets, vias, up in (
+                (self.up_offsets, self.up_targets, self.up_via, True),
+                (self.down_offsets, self.down_targets, self.down_via, False),
+            ):
+                vias = np.asarray(vias)
+                edges = np.flatnonzero(vias != -1)
+                owners = np.searchsorted(np.asarray(offsets), edges, side='right') - 1
+                others = np.asarray(targets)[edges]
+                pairs = zip(owners.tolist(), others.tolist()) if up else zip(others.tolist(), owners.tolist())
+                via.update(zip(pairs, vias[edges].tolist()))
+            self._shortcut_via = via
+        return via
+
+
+def _to_csr(n, adjacency, weight_dtype=np.float64):
+    counts = [len(edges) for edges in adjacency]
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    flat = [edge for edges in adjacency for edge in edges]
+    targets = np.array([e[0] for e in flat], dtype=np.int32)
+    weights = np.array([e[1] for e in flat], dtype=weight_dtype)
+    via = np.array([e[2] for e in flat], dtype=np.int32)
+    return offsets, targets, weights, via
+
+
+def build_hierarchy(graph, witness_settle_limit=WITNESS_SETTLE_LIMIT):
+    """
+    Contracts nodes in edge-difference order (lazy updates). Pure Python,
+    meant to run once per cached graph; queries afterwards are tiny searches.
+    """
+    n = graph.num_nodes
+    out_adj = [dict() for _ in range(n)]
+    in_adj = [dict() for _ in range(n)]
+    offsets, targets, weights = graph.offsets, graph.targets.tolist(), graph.weights.tolist()
+    for u in range(n):
+        for e in range(int(offsets[u]), int(offsets[u + 1])):
+            v, w = targets[e], weights[e]
+            if u != v and w < out_adj[u].get(v, (INF,))[0]:
+                out_adj[u][v] = (w, -1)
+                in_adj[v][u] = (w, -1)
+
+    def witness(source, skip, max_cost, wanted):
+        dist = {source: 0}
+        queue = [(0, source)]
+        settled = 0
+        remaining = set(wanted)
+        while queue and remaining and settled < witness_settle_limit:
+            d, x = heapq.heappop(queue)
+            if d > dist[x]:
+                continue
+            if d > max_cost:
+                break
+            settled += 1
+            remaining.discard(x)
+            for y, (w, _) in out_adj[x].items():
+                if y == skip:
+                    continue
+                nd = d + w
+                if nd < dist.get(y, INF):
+                    dist[y] = nd
+                    heapq.heappush(queue, (nd, y))
+        return dist
+
+    def needed_shortcuts(v):
+        shortcuts = []
+        for u, (w_in, _) in in_adj[v].items():
+            wanted = {x: w_in + w_out for x, (w_out, _) in out_adj[v].items() if x != u}
+            if not wanted:
+                continue
+            dist = witness(u, v, max(wanted.values()), wanted)
+            for x, cost in wanted.items():
+                if dist.get(x, INF) > cost:
+                    shortcuts.append((u, x, cost))
+        return shortcuts
+
+    deleted_neighbors = [0] * n
+
+    def priority(v):
+        shortcuts = needed_shortcuts(v)
+        return len(shortcuts) - len(in_adj[v]) - len(out_adj[v]) + deleted_neighbors[v], shortcuts
+
+    queue = [(priority(v)[0], v) for v in range(n)]
+    heapq.heapify(queue)
+
+    rank = np.zeros(n, dtype=np.int32)
+    up = [[] for _ in range(n)]
+    down = [[] for _ in range(n)]
+    contracted = [False] * n
+    level = 0
+
+    while queue:
+        _, v = heapq.heappop(queue)
+        if contracted[v]:
+            continue
+        p, shortcuts = priority(v)
+        if queue and p > queue[0][0]:
+            heapq.heappush(queue, (p, v))
+            continue
+
+        for u, x, cost in shortcuts:
+            if cost < out_adj[u].get(x, (INF,))[0]:
+                out_adj[u][x] = (cost, v)
+                in_adj[x][u] = (cost, v)
+
+        # Every remaining neighbour is contracted later, i.e. ranks higher
+        up[v] = [(x, w, via) for x, (w, via) in out_adj[v].items()]
+        down[v] = [(u, w, via) for u, (w, via) in in_adj[v].items()]
+        for x in out_adj[v]:
+            del in_adj[x][v]
+            deleted_neighbors[x] += 1
+        for u in in_adj[v]:
+            del out_adj[u][v]
+            deleted_neighbors[u] += 1
+        out_adj[v], in_adj[v] = {}, {}
+
+        contracted[v] = True
+        rank[v] = level
+        level += 1
+
+    up_offsets, up_targets, up_weights, up_via = _to_csr(n, up)
+    down_offsets, down_targets, down_weights, down_via = _to_csr(n, down)
+    return ContractionHierarchy(
+        rank=rank,
+        up_offsets=up_offsets, up_targets=up_targets, up_weights=up_weights, up_via=up_via,
+        down_offsets=down_offsets, down_targets=down_targets, down_weights=down_weights, down_via=down_via,
+    )
+
+
+def get_hierarchy(graph):
+    """
+    Hierarchy for a CSR graph: in-process -> next to the graph on disk.
+    None when it was never prepared: contraction takes minutes on a city
+    graph, so it only runs offline (prepare_hierarchy), never in a request.
+    """
+    hierarchy = graph.artifacts.get('hierarchy')
+    if hierarchy is not None:
+        return hierarchy
+
+    if not graph.directory or not ContractionHierarchy.exists(graph.directory):
+        return None
+    hierarchy = ContractionHierarchy.load(graph.directory)
+    graph.artifacts['hierarchy'] = hierarchy
+    return hierarchy
+
+
+def prepare_hierarchy(graph):
+    """Builds the hierarchy and saves it next to the graph (graph_store seeding, benchmarks)."""
+    hierarchy = build_hierarchy(graph)
+    if graph.directory:
+        hierarchy.save(graph.directory)
+    graph.artifacts['hierarchy'] = hierarchy
+    return hierarchy
+
+
+def _upward_search(offsets, targets, weights, via, sources):
+    """Full Dijkstra restricted to upward edges; CH search spaces are small."""
+    dist = dict(sources)
+    prev = {s: None for s in sources}
+    queue = [(cost, s) for s, cost in sources.items()]
+    heapq.heapify(queue)
+    while queue:
+        d, x = heapq.heappop(queue)
+        if d > dist[x]:
+            continue
+        lo, hi = offsets[x], offsets[x + 1]
+        for y, w, mid in zip(targets[lo:hi].tolist(), weights[lo:hi].tolist(), via[lo:hi].tolist()):
+            nd = d + w
+            if nd < dist.get(y, INF):
+                dist[y] = nd
+                prev[y] = (x, mid)
+                heapq.heappush(queue, (nd, y))
+    return dist, prev
+
+
+class ContractionHierarchyEngine:
+    """
+    Many-to-many CH query: one upward search per source, one (cached) upward
+    search per target on the reverse side, distance = best common node.
+    """
+    name = 'ch'
+
+    def __init__(self, graph, hierarchy):
+        self.graph = graph
+        self.ch = hierarchy
+        self._backward = {}
+        self._via = hierarchy.shortcut_via()
+
+    def _backward_search(self, target):
+        space = self._backward.get(target)
+        if space is None:
+            ch = self.ch
+            space = _upward_search(ch.down_offsets, ch.down_targets, ch.down_weights, ch.down_via, {target: 0})
+            count('search_nodes', len(space[0]))
+            self._backward[target] = space
+        return space
+
+    def one_to_many(self, sources, targets):
+        ch = self.ch
+        forward_dist, forward_prev = _upward_search(ch.up_offsets, ch.up_targets, ch.up_weights, ch.up_via, sources)
+        count('search_nodes', len(forward_dist))
+
+        distances, meets = {}, {}
+        for target in targets:
+            backward_dist, _ = self._backward_search(target)
+            small, large = (forward_dist, backward_dist) if len(forward_dist) <= len(backward_dist) else (backward_dist, forward_dist)
+            best, meet = INF, None
+            for node, d in small.items():
+                other = large.get(node)
+                if other is not None and d + other < best:
+                    best, meet = d + other, node
+            distances[target], meets[target] = best, meet
+        return distances, (forward_prev, meets)
+
+    def _unpack(self, a, b, mid, out):
+        """Appends the original nodes of edge a -> b (excluding a) to out."""
+        via = self._via
+        stack = [(a, b, mid)]
+        while stack:
+            x, y, m = stack.pop()
+            if m == -1:
+                out.append(y)
+            else:
+                # Expand x -> m first, so push m -> y underneath it
+                stack.append((m, y, via.get((m, y), -1)))
+                stack.append((x, m, via.get((x, m), -1)))
+
+    def path(self, tree, target):
+        forward_prev, meets = tree
+        meet = meets[target]
+        if meet is None:
+            return []
+
+        # Upward chain seed -> meet
+        chain = []
+        node = meet
+        while forward_prev[node] is not None:
+            parent, mid = forward_prev[node]
+            chain.append((parent, node, mid))
+            node = parent
+        chain.reverse()
+
+        path = [node]
+        for a, b, mid in chain:
+            self._unpack(a, b, mid, path)
+
+        # Downward chain meet -> target (backward prev pointers point towards target)
+        _, backward_prev = self._backward_search(target)
+        node = meet
+        while backward_prev[node] is not None:
+            child, mid = backward_prev[node]
+            self._unpack(node, child, mid, path)
+            node = child
+        return path
+
+
+ENGINES = {
+    'dijkstra': DijkstraEngine,
+    'astar': BidirectionalAStarEngine,
+    'ch': ContractionHierarchyEngine,
+}
+
+
+def get_engine(name, graph):
+    """
+    Engine `name` on graph. 'ch' falls back to Dijkstra (same distances) when
+    the graph has no prebuilt hierarchy; the returned engine's name tells which ran.
+    """
+    if name not in ENGINES:
+        raise ValueError(f"engine must be one of {list(ENGINES)}")
+    if name == 'ch':
+        hierarchy = get_hierarchy(graph)
+        if hierarchy is None:
+            count('ch_fallback')
+            return DijkstraEngine(graph)
+        return ContractionHierarchyEngine(graph, hierarchy)
+    return ENGINES[name](graph)
+
+
+# --- VERIFICATION ---
+def compare_with_dijkstra(graph, name, pairs, tolerance=1e-6):
+    """
+    Runs every (source, target) node pair through both engines and returns the
+    pairs whose distances differ by more than `tolerance` meters.
+    """
+    reference = DijkstraEngine(graph)
+    engine = get_engine(name, graph)
+    if engine.name != name:
+        raise ValueError(f"engine '{name}' is not prepared for this graph (got {engine.name})")
+    mismatches = []
+    for source, target in pairs:
+        expected, _ = reference.one_to_many({source: 0}, {target})
+        actual, tree = engine.one_to_many({source: 0}, {target})
+        e, a = expected[target], actual[target]
+        path = engine.path(tree, target)
+        path_length = sum(graph.edge_weight(x, y) for x, y in zip(path, path[1:])) if path else INF
+        if not (e == a == INF) and (abs(e - a) > tolerance or abs(path_length - a) > tolerance):
+            mismatches.append((source, target, e, a, path_length))
+    return mismatches
+
+
+if __name__ == '__main__':
+    import argparse
+    import random
+    import time
+
+    from csr_graph import CSRGraph
+
+    parser = argparse.ArgumentParser(description="Preprocess a cached CSR graph and check engines against Dijkstra")
+    parser.add_argument('directory', help="CSR graph directory from the graph store cache")
+    parser.add_argument('--pairs', type=int, default=200)
+    args = parser.parse_args()
+
+    csr = CSRGraph.load(args.directory)
+    started = time.perf_counter()
+    if get_hierarchy(csr) is None:
+        prepare_hierarchy(csr)
+    print(f"Contraction hierarchy ready in {time.perf_counter() - started:.1f}s")
+
+    rng = random.Random(0)
+    pairs = [(rng.randrange(csr.num_nodes), rng.randrange(csr.num_nodes)) for _ in range(args.pairs)]
+    for engine_name in ('astar', 'ch'):
+        started = time.perf_counter()
+        bad = compare_with_dijkstra(csr, engine_name, pairs)
+        print(f"{engine_name}: {len(bad)} mismatches over {len(pairs)} pairs ({time.perf_counter() - started:.2f}s)")
+        for mismatch in bad[:10]:
+            print(f"  {mismatch}")
@@ -0,0 +1,192 @@
+import math
+import os
+import pickle
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_M = 6371000
+INDEX_FILE = 'spatial_index.pkl'
+SNAP_MODES = ('node', 'edge')
+# Nearest nodes whose outgoing edges are tested when snapping onto an edge
+EDGE_CANDIDATES = 8
+
+
+# --- SPATIAL INDEX ---
+class SpatialIndex:
+    """KD-tree over node coordinates projected onto a local plane in meters."""
+
+    def __init__(self, ref_lat, tree=None):
+        self.ref_lat = ref_lat
+        self.tree = tree
+        self._cos_ref = math.cos(math.radians(ref_lat))
+
+    @classmethod
+    def build(cls, graph):
+        ref_lat = float(np.mean(graph.lat)) if graph.num_nodes else 0.0
+        index = cls(ref_lat)
+        index.tree = cKDTree(index.project(graph.lat, graph.lng))
+        return index
+
+    def project(self, lats, lngs):
+        """Equirectangular projection around ref_lat; accurate to <1% at city scale."""
+        x = np.radians(np.asarray(lngs, dtype=np.float64)) * EARTH_RADIUS_M * self._cos_ref
+        y = np.radians(np.asarray(lats, dtype=np.float64)) * EARTH_RADIUS_M
+        return np.column_stack((x, y))
+
+    def unproject(self, xy):
+        lats = np.degrees(xy[:, 1] / EARTH_RADIUS_M)
+        lngs = np.degrees(xy[:, 0] / (EARTH_RADIUS_M * self._cos_ref))
+        return lats, lngs
+
+    def save(self, path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+def get_spatial_index(graph):
+    """Index for a CSR graph: in-process -> next to the graph on disk -> built and saved."""
+    index = graph.artifacts.get('spatial_index')
+    if index is not None:
+        return index
+
+    path = os.path.join(graph.directory, INDEX_FILE) if graph.directory else None
+    if path and os.path.exists(path):
+        index = SpatialIndex.load(path)
+    else:
+        index = SpatialIndex.build(graph)
+        if path:
+            index.save(path)
+
+    graph.artifacts['spatial_index'] = index
+    return index
+
+
+# --- SNAPPING ---
+def _node_snap(graph, node, distance):
+    return {
+        "node": node,
+        "distance": distance,
+        "lat": float(graph.lat[node]),
+        "lng": float(graph.lng[node]),
+        "edge": None,
+        # Where a search may start from / must arrive at, with the extra walk to add
+        "sources": {node: 0.0},
+        "targets": {node: 0.0},
+    }
+
+
+def _edge_snap(graph, index, point_xy, candidates):
+    """Closest straight segment among the outgoing edges of the candidate nodes."""
+    offsets, targets = graph.offsets, graph.targets
+    us, vs = [], []
+    for u in candidates:
+        lo, hi = offsets[u], offsets[u + 1]
+        vs.extend(targets[lo:hi].tolist())
+        us.extend([u] * int(hi - lo))
+    if not us:
+        return None
+
+    us = np.array(us)
+    vs = np.array(vs)
+    a = index.tree.data[us]
+    ab = index.tree.data[vs] - a
+    length_sq = np.einsum('ij,ij->i', ab, ab)
+    t = np.einsum('ij,ij->i', point_xy - a, ab) / np.where(length_sq > 0, length_sq, 1)
+    t = np.clip(t, 0.0, 1.0)
+    projected = a + ab * t[:, None]
+    dists = np.linalg.norm(projected - point_xy, axis=1)
+
+    best = int(np.argmin(dists))
+    return int(us[best]), int(vs[best]), float(t[best]), float(dists[best]), projected[best]
+
+
+def snap_points(graph, points, mode='node'):
+    """
+    Snaps all (lat, lng) points in one batched KD-tree query.
+    mode='node' snaps to the closest node; mode='edge' snaps onto the closest
+    edge (approximated by the straight line between its end nodes) and splits
+    it at the projected point. Returns one snap dict per point with the snap
+    distance in meters.
+    """
+    if mode not in SNAP_MODES:
+        raise ValueError(f"snap mode must be one of {list(SNAP_MODES)}")
+    if graph.num_nodes == 0:
+        raise ValueError("Cannot snap points onto a graph without nodes")
+
+    index = get_spatial_index(graph)
+    lats = [float(p[0]) for p in points]
+    lngs = [float(p[1]) for p in points]
+    points_xy = index.project(lats, lngs)
+
+    if mode == 'node':
+        dists, nodes = index.tree.query(points_xy, k=1)
+        return [_node_snap(graph, int(n), float(d)) for n, d in zip(nodes, dists)]
+
+    k = min(EDGE_CANDIDATES, graph.num_nodes)
+    dists, nodes = index.tree.query(points_xy, k=k)
+    nodes = np.asarray(nodes).reshape(len(points), k)
+    dists = np.asarray(dists).reshape(len(points), k)
+
+    snaps = []
+    for i in range(len(points)):
+        best = _edge_snap(graph, index, points_xy[i], nodes[i].tolist())
+        if best is None or best[3] >= dists[i][0]:
+            # Nearest node is at least as close as any edge (dead end / isolated node)
+            snaps.append(_node_snap(graph, int(nodes[i][0]), float(dists[i][0])))
+            continue
+
+        u, v, t, distance, split_xy = best
+        split_lat, split_lng = index.unproject(split_xy[None, :])
+        forward = graph.edge_weight(u, v)
+        backward = graph.edge_weight(v, u)
+
+        sources = {v: (1 - t) * forward}
+        targets = {u: t * forward}
+        if backward is not None:
+            # Edge is walkable both ways, so the point also connects back to u / from v
+            sources[u] = t * backward
+            targets[v] = (1 - t) * backward
+
+        snaps.append({
+            "node": u if t < 0.5 else v,
+            "distance": distance,
+            "lat": float(split_lat[0]),
+            "lng": float(split_lng[0]),
+            "edge": {"u": u, "v": v, "fraction": t},
+            "sources": sources,
+            "targets": targets,
+        })
+    return snaps
+
+
+def along_edge_distance(graph, src, tgt):
+    """
+    Walk from src straight along the edge both points were snapped onto, or
+    None if they lie on different edges (or the edge only runs the other way).
+    A search between the two would have to leave through an end node and come back.
+    """
+    a, b = src["edge"], tgt["edge"]
+    if a is None or b is None:
+        return None
+    u, v, t_src = a["u"], a["v"], a["fraction"]
+    if (b["u"], b["v"]) == (u, v):
+        t_tgt = b["fraction"]
+    elif (b["u"], b["v"]) == (v, u):
+        # Same two-way edge, found from its other end
+        t_tgt = 1 - b["fraction"]
+    else:
+        return None
+
+    if t_tgt >= t_src:
+        weight, share = graph.edge_weight(u, v), t_tgt - t_src
+    else:
+        weight, share = graph.edge_weight(v, u), t_src - t_tgt
+    return None if weight is None else share * weight
@@ -0,0 +1,286 @@
+import time
+
+from instrumentation import count
+
+# Matrix layout used by every solver in this module:
+#   0        -> start
+#   1..n     -> waypoints (waypoint i lives at index i + 1)
+#   n + 1    -> end
+# dist[a][b] is the walking distance from a to b (float('inf') if unreachable).
+
+INF = float('inf')
+
+# Held-Karp is O(2^n * n^2); past this many waypoints "auto" switches to the heuristic
+AUTO_EXACT_MAX_WAYPOINTS = 12
+# Hard cap for an explicitly requested exact solve (keeps memory/time bounded)
+EXACT_MAX_WAYPOINTS = 16
+
+SOLVERS = ('auto', 'exact', 'heuristic')
+
+# Finite stand-in for inf inside the local search so deltas never become NaN.
+# 10,000 km dwarfs any walking leg but keeps float rounding well below _EPS.
+_UNREACHABLE = 1e7
+# Minimum gain (meters) for a local-search move, guards against float cycling
+_EPS = 1e-6
+
+
+def _improves(new, old):
+    return new < old - _EPS
+
+
+def path_cost(dist, sequence):
+    """Total cost of walking the given sequence of matrix indices."""
+    total = 0
+    for i in range(len(sequence) - 1):
+        d = dist[sequence[i]][sequence[i + 1]]
+        if d == INF:
+            return INF
+        total += d
+    return total
+
+
+# --- LOWER BOUND ---
+def path_lower_bound(dist, n):
+    """
+    Cheap lower bound for any start -> (all waypoints) -> end path.
+    Every waypoint and the end is entered exactly once, and the start and
+    every waypoint is left exactly once, so the best of the two sums of
+    minimum edges bounds the optimum from below.
+    """
+    end = n + 1
+    waypoints = range(1, n + 1)
+
+    incoming = 0
+    for v in list(waypoints) + [end]:
+        preds = [0] + [u for u in waypoints if u != v]
+        incoming += min(dist[u][v] for u in preds)
+
+    outgoing = 0
+    for u in [0] + list(waypoints):
+        succs = [v for v in waypoints if v != u] + [end]
+        outgoing += min(dist[u][v] for v in succs)
+
+    return max(incoming, outgoing)
+
+
+# --- EXACT: HELD-KARP ---
+def held_karp(dist, n):
+    """
+    Bitmask DP for the open path start -> all waypoints -> end.
+    Returns (distance, sequence of matrix indices).
+    """
+    end = n + 1
+    if n == 0:
+        return dist[0][end], [0, end]
+
+    full = (1 << n) - 1
+    # cost[mask][j]: cheapest path from start covering `mask`, ending on waypoint j
+    cost = [[INF] * n for _ in range(1 << n)]
+    parent = [[-1] * n for _ in range(1 << n)]
+
+    for j in range(n):
+        cost[1 << j][j] = dist[0][j + 1]
+
+    for mask in range(1, full + 1):
+        row = cost[mask]
+        for j in range(n):
+            base = row[j]
+            if base == INF or not (mask >> j) & 1:
+                continue
+            from_j = dist[j + 1]
+            for k in range(n):
+                if (mask >> k) & 1:
+                    continue
+                d = from_j[k + 1]
+                if d == INF:
+                    continue
+                nxt = mask | (1 << k)
+                candidate = base + d
+                if candidate < cost[nxt][k]:
+                    cost[nxt][k] = candidate
+                    parent[nxt][k] = j
+
+    best_distance = INF
+    best_last = -1
+    for j in range(n):
+        candidate = cost[full][j] + dist[j + 1][end]
+        if candidate < best_distance:
+            best_distance = candidate
+            best_last = j
+
+    if best_last == -1:
+        return INF, []
+
+    # Walk the parent pointers back to the start
+    order = []
+    mask, j = full, best_last
+    while j != -1:
+        order.append(j + 1)
+        prev = parent[mask][j]
+        mask ^= 1 << j
+        j = prev
+    order.reverse()
+
+    return best_distance, [0] + order + [end]
+
+
+# --- HEURISTIC: NEAREST NEIGHBOUR + 2-OPT / OR-OPT ---
+def nearest_neighbour(dist, n):
+    """Greedy construction: always walk to the closest unvisited waypoint."""
+    unvisited = set(range(1, n + 1))
+    sequence = [0]
+    current = 0
+    while unvisited:
+        row = dist[current]
+        current = min(unvisited, key=lambda v: (row[v], v))
+        unvisited.remove(current)
+        sequence.append(current)
+    sequence.append(n + 1)
+    return sequence
+
+
+def two_opt(dist, sequence, stop=None):
+    """
+    Segment reversal until no improving move is left. Works on asymmetric
+    matrices: reversed segment cost comes from prefix sums of the backward edges.
+    Start and end stay fixed. When stop() turns true the search ends early
+    with the moves made so far.
+    """
+    improved = True
+    while improved:
+        improved = False
+        size = len(sequence)
+        fwd = [0] * size
+        bwd = [0] * size
+        for t in range(1, size):
+            fwd[t] = fwd[t - 1] + dist[sequence[t - 1]][sequence[t]]
+            bwd[t] = bwd[t - 1] + dist[sequence[t]][sequence[t - 1]]
+
+        for i in range(1, size - 2):
+            if stop is not None and stop():
+                return sequence
+            a = sequence[i - 1]
+            for k in range(i + 1, size - 1):
+                b = sequence[k + 1]
+                old = dist[a][sequence[i]] + (fwd[k] - fwd[i]) + dist[sequence[k]][b]
+                new = dist[a][sequence[k]] + (bwd[k] - bwd[i]) + dist[sequence[i]][b]
+                if _improves(new, old):
+                    sequence[i:k + 1] = reversed(sequence[i:k + 1])
+                    improved = True
+                    break
+            if improved:
+                break
+    return sequence
+
+
+def or_opt(dist, sequence, max_segment=3, stop=None):
+    """Relocate chains of 1..max_segment waypoints to a cheaper position (until stop(), like two_opt)."""
+    improved = True
+    while improved:
+        improved = False
+        size = len(sequence)
+        for length in range(1, max_segment + 1):
+            for i in range(1, size - length):
+                if stop is not None and stop():
+                    return sequence
+                j_end = i + length - 1
+                if j_end >= size - 1:
+                    break
+                p, q = sequence[i - 1], sequence[j_end + 1]
+                first, last = sequence[i], sequence[j_end]
+                removed = dist[p][first] + dist[last][q] - dist[p][q]
+
+                for j in range(size - 1):
+                    if i - 1 <= j <= j_end:
+                        continue
+                    x, y = sequence[j], sequence[j + 1]
+                    added = dist[x][first] + dist[last][y] - dist[x][y]
+                    if _improves(added, removed):
+                        segment = sequence[i:j_end + 1]
+                        rest = sequence[:i] + sequence[j_end + 1:]
+                        insert_at = j + 1 if j < i else j + 1 - length
+                        sequence[:] = rest[:insert_at] + segment + rest[insert_at:]
+                        improved = True
+                        break
+                if improved:
+                    break
+            if improved:
+                break
+    return sequence
+
+
+def heuristic_order(dist, n):
+    """Nearest neighbour seed improved by alternating 2-opt and Or-opt passes."""
+    end = n + 1
+    if n == 0:
+        return dist[0][end], [0, end]
+
+    local = [[d if d != INF else _UNREACHABLE for d in row] for row in dist]
+    sequence = nearest_neighbour(local, n)
+
+    best = path_cost(local, sequence)
+    while True:
+        two_opt(local, sequence)
+        or_opt(local, sequence)
+        count('tsp_local_search_rounds')
+        current = path_cost(local, sequence)
+        if not _improves(current, best):
+            break
+        best = current
+
+    return path_cost(dist, sequence), sequence
+
+
+# --- DISPATCH ---
+def solve_order(dist, n, solver='auto'):
+    """
+    Orders n waypoints between a fixed start and end.
+    Returns (distance, sequence, info) where info reports which solver ran,
+    whether the result is provably optimal, and a lower bound / gap.
+    """
+    if solver not in SOLVERS:
+        raise ValueError(f"Unknown solver '{solver}'. Expected one of {list(SOLVERS)}")
+
+    if solver == 'auto':
+        solver = 'exact' if n <= AUTO_EXACT_MAX_WAYPOINTS else 'heuristic'
+
+    if solver == 'exact' and n > EXACT_MAX_WAYPOINTS:
+        raise ValueError(f"Exact solver supports at most {EXACT_MAX_WAYPOINTS} waypoints (got {n})")
+
+    started = time.perf_counter()
+    if solver == 'exact':
+        distance, sequence = held_karp(dist, n)
+        name = 'held_karp'
+        # (subset, last waypoint) states, each extended by up to n waypoints
+        count('tsp_states', (1 << n) * n)
+    else:
+        distance, sequence = heuristic_order(dist, n)
+        name = 'nearest_neighbour_2opt_oropt'
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    info = {
+        "name": name,
+        "waypoints": n,
+        # Only a route that exists can be proven optimal
+        "optimal": solver == 'exact' and distance != INF,
+        "time_ms": round(elapsed_ms, 3),
+    }
+
+    if solver == 'exact':
+        info["lower_bound"] = distance if distance != INF else None
+        info["gap"] = 0.0 if distance != INF else None
+    else:
+        lower = path_lower_bound(dist, n)
+        if distance == INF or lower == INF:
+            info["lower_bound"] = None
+            info["gap"] = None
+        else:
+            info["lower_bound"] = lower
+            # Upper bound on how far from optimal the heuristic can be
+            # A zero bound only proves optimality for a zero-length route
+            if lower > 0:
+                info["gap"] = (distance - lower) / lower
+            else:
+                info["gap"] = 0.0 if distance == 0 else None
+
+    return distance, sequence, info
@@ -2,7 +2,13 @@ import functions_framework
 from flask import jsonify
 import firebase_admin
 from firebase_admin import credentials, firestore
-from transformers import pipeline
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from onnx_backend import load_classifier
+from verdict_cache import FirestoreVerdictStore, VerdictCache
+from instrumentation import Trace, count
+from microbatch import MicroBatcher
 
 # --- SETUP ---
 if not firebase_admin._apps:
@@ -12,65 +18,133 @@ db = firestore.client()
 
 # Initialize Sentiment Analysis Model
 # We print this immediately as it happens during cold start
-print("[SentimentAnalysis] Loading sentiment analysis model...")
-sentiment_pipeline = pipeline("sentiment-analysis", model="distilbert-base-uncased-finetuned-sst-2-english")
+# 'torch' (default) or 'onnx' (int8 onnxruntime, no PyTorch import); see onnx_backend.py
+SENTIMENT_BACKEND = os.environ.get('SENTIMENT_BACKEND', 'torch')
+SENTIMENT_MODEL_NAME = os.environ.get('SENTIMENT_MODEL_NAME', 'distilbert-base-uncased-finetuned-sst-2-english')
+print(f"[SentimentAnalysis] Loading sentiment analysis model ({SENTIMENT_BACKEND})...")
+sentiment_pipeline = load_classifier(SENTIMENT_BACKEND, SENTIMENT_MODEL_NAME, os.environ.get('SENTIMENT_ONNX_DIR'))
 print("[SentimentAnalysis] Model loaded.")
 
-def get_place_reviews(place_id, logger):
-    """Fetches reviews for a place from Firestore."""
-    try:
-        doc = db.collection('places').document(place_id).get()
-        if doc.exists:
-            data = doc.to_dict()
-            reviews = data.get('ratings', [])
-            logger.append(f"Found {len(reviews)} reviews for {place_id} in Firestore.")
-            return reviews
-        return []
-    except Exception as e:
-        logger.append(f"Error fetching reviews for {place_id}: {e}")
-        return []
-
-def is_place_acceptable(place, logger):
+# Reviews per forward pass; requests may lower/raise it up to MAX_BATCH_SIZE
+SENTIMENT_BATCH_SIZE = int(os.environ.get('SENTIMENT_BATCH_SIZE', 32))
+MAX_BATCH_SIZE = 128
+MAX_TOKENS = 512
+MIN_REVIEW_COUNT = 3
+
+# Micro-batching: when served with several threads per worker (see gunicorn.conf.py),
+# reviews of concurrent requests arriving within the window share forward passes of
+# SENTIMENT_BATCH_SIZE (a request's own batch_size then only sets how often it flushes).
+# 0 (default) classifies each request on its own thread.
+MICROBATCH_WINDOW_MS = float(os.environ.get('SENTIMENT_MICROBATCH_WINDOW_MS', 0))
+MICROBATCH_MAX_REVIEWS = int(os.environ.get('SENTIMENT_MICROBATCH_MAX_REVIEWS', 512))
+
+# Firestore fetch: documents per get_all round trip, and round trips in flight at once
+FETCH_CHUNK_SIZE = int(os.environ.get('SENTIMENT_FETCH_CHUNK_SIZE', 10))
+FETCH_WORKERS = int(os.environ.get('SENTIMENT_FETCH_WORKERS', 4))
+
+# Verdicts are cached per model and backend (int8 ONNX may disagree with fp32 on edge cases).
+# Set SENTIMENT_VERDICT_COLLECTION to also persist them in Firestore across instances.
+MODEL_VERSION = f"{SENTIMENT_MODEL_NAME}+{SENTIMENT_BACKEND}"
+VERDICT_COLLECTION = os.environ.get('SENTIMENT_VERDICT_COLLECTION', '')
+verdict_cache = VerdictCache(
+    MODEL_VERSION, store=FirestoreVerdictStore(db, VERDICT_COLLECTION) if VERDICT_COLLECTION else None
+)
+
+def fetch_reviews_chunk(client, place_ids):
+    """One batched get_all round trip. Returns {place_id: reviews} for documents that exist."""
+    refs = [client.collection('places').document(place_id) for place_id in place_ids]
+    found = {}
+    for snapshot in client.get_all(refs):
+        if snapshot.exists:
+            found[snapshot.id] = (snapshot.to_dict() or {}).get('ratings') or []
+    return found
+
+def iter_place_reviews(place_ids, logger, client=None):
+    """
+    Fetches reviews for many places with chunked get_all calls on a bounded
+    thread pool, yielding {place_id: reviews} per chunk as soon as it lands so
+    the caller can run inference while the other chunks are still in flight.
+    Missing documents and failed chunks yield [] (Google-rating fallback).
+    `client` is any Firestore-like client (emulator via FIRESTORE_EMULATOR_HOST,
+    or an in-memory stand-in); defaults to the service's client.
+    """
+    client = client or db
+    ids = list(dict.fromkeys(place_id for place_id in place_ids if place_id))
+    chunks = [ids[i:i + FETCH_CHUNK_SIZE] for i in range(0, len(ids), FETCH_CHUNK_SIZE)]
+    if not chunks:
+        return
+
+    with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(chunks))) as pool:
+        futures = {pool.submit(fetch_reviews_chunk, client, chunk): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            chunk = futures[future]
+            count('firestore_get_all')
+            try:
+                found = future.result()
+            except Exception as e:
+                logger.append(f"Error fetching reviews for {chunk}: {e}")
+                found = {}
+
+            for place_id in chunk:
+                if place_id in found:
+                    logger.append(f"Found {len(found[place_id])} reviews for {place_id} in Firestore.")
+            yield {place_id: found.get(place_id, []) for place_id in chunk}
+
+def review_input(review):
+    """Model input for a review, or None if it has no text (rating-only review)."""
+    text = review.get('review', '')
+    if text and text.strip():
+        return f"Rating: {review.get('rating', 0)}/5. {text}"
+    return None
+
+def classify_reviews(texts, batch_size):
+    """
+    Classifies all texts in size-bounded batches. Texts are sorted by length
+    so each batch pads to similar lengths; the tokenizer truncates to MAX_TOKENS.
+    Returns (results in input order, number of batches).
+    """
+    results = [None] * len(texts)
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    batches = 0
+    for start in range(0, len(order), batch_size):
+        idx = order[start:start + batch_size]
+        batch_results = sentiment_pipeline(
+            [texts[i] for i in idx], batch_size=len(idx), truncation=True, max_length=MAX_TOKENS
+        )
+        for i, result in zip(idx, batch_results):
+            results[i] = result
+        batches += 1
+    return results, batches
+
+def classify_merged(texts):
+    return classify_reviews(texts, SENTIMENT_BATCH_SIZE)[0]
+
+classify_batcher = MicroBatcher(classify_merged, MICROBATCH_MAX_REVIEWS, MICROBATCH_WINDOW_MS, name='sentiment-classify')
+
+def is_review_bad(place_id, review, verdict, logger):
+    """A review is bad if the model says NEGATIVE, or for rating-only reviews if rated below 3."""
+    text = review.get('review', '')
+    rating = review.get('rating', 0)
+
+    if verdict is not None:
+        # Log detailed sentiment result
+        logger.append(f"Review for {place_id}: '{text[:30]}...' -> Label: {verdict['label']}, Score: {verdict['score']:.4f}")
+        return verdict['label'] == 'NEGATIVE'
+
+    if rating < 3:
+        logger.append(f"Review for {place_id} (No Text): Rating {rating} -> BAD")
+        return True
+    return False
+
+def is_place_acceptable(place, firebase_review_count, bad_reviews_count, logger):
     """
     Decides if a place should be kept based on sentiment analysis and ratings.
+    bad_reviews_count is only used when the place has at least MIN_REVIEW_COUNT reviews.
     """
     place_id = place.get('placeId') or place.get('id')
     google_rating = place.get('rating')
-    
-    # 1. Fetch Firebase Reviews
-    reviews = get_place_reviews(place_id, logger)
-    
-    firebase_review_count = len(reviews)
-    MIN_REVIEW_COUNT = 3
-    
+
     if firebase_review_count >= MIN_REVIEW_COUNT:
-        bad_reviews_count = 0
-        
-        for r in reviews:
-            text = r.get('review', '')
-            rating = r.get('rating', 0)
-            
-            is_bad = False
-            
-            if text and text.strip():
-                input_text = f"Rating: {rating}/5. {text}"
-                
-                # Truncate to avoid model errors
-                result = sentiment_pipeline(input_text[:512])[0]
-                
-                # Log detailed sentiment result
-                logger.append(f"Review for {place_id}: '{text[:30]}...' -> Label: {result['label']}, Score: {result['score']:.4f}")
-                
-                if result['label'] == 'NEGATIVE':
-                    is_bad = True
-            else:
-                if rating < 3:
-                    is_bad = True
-                    logger.append(f"Review for {place_id} (No Text): Rating {rating} -> BAD")
-            
-            if is_bad:
-                bad_reviews_count += 1
-        
         bad_ratio = bad_reviews_count / firebase_review_count
         logger.append(f"Place {place_id} stats: {bad_reviews_count}/{firebase_review_count} bad ({bad_ratio:.2%})")
 
@@ -109,38 +183,134 @@ def filter_places_sentiment(request):
 
     headers = {'Access-Control-Allow-Origin': '*'}
 
-    # Initialize Log Buffer
-    log_buffer = []
+    # Per-request spans, counters and log lines, printed as one JSON entry.
+    # Helpers that log take the trace as their logger (it has .append)
+    trace = Trace('sentiment_analysis')
     def dlog(msg):
-        log_buffer.append(str(msg))
+        trace.log(str(msg))
 
     dlog("===== START: FILTER PLACES SENTIMENT =====")
 
     request_json = request.get_json(silent=True)
     if not request_json or 'places' not in request_json:
         dlog("Error: Missing 'places' in request")
-        print("\n".join(log_buffer))
+        trace.emit(400)
         return (jsonify({"error": "Missing 'places' in request"}), 400, headers)
 
     places = request_json['places']
     
     if not isinstance(places, list):
         dlog("Error: 'places' must be a list")
-        print("\n".join(log_buffer))
+        trace.emit(400)
         return (jsonify({"error": "'places' must be a list"}), 400, headers)
 
     dlog(f"Received request to filter {len(places)} places.")
 
+    batch_size = request_json.get('batch_size', SENTIMENT_BATCH_SIZE)
+    if not isinstance(batch_size, int) or isinstance(batch_size, bool) or not 1 <= batch_size <= MAX_BATCH_SIZE:
+        dlog(f"Error: invalid batch_size {batch_size}")
+        trace.emit(400)
+        return (jsonify({"error": f"batch_size must be an integer between 1 and {MAX_BATCH_SIZE}"}), 400, headers)
+
+    # 1+2. Fetch reviews in concurrent get_all chunks and classify them while
+    # later chunks are still in flight. Reviews already aggregated for a place,
+    # or with a cached verdict, are skipped; full batches of the rest run as
+    # soon as enough texts are queued and the remainder is flushed at the end.
+    # Places below MIN_REVIEW_COUNT use the Google rating, so their reviews are skipped
+    stage_start = time.perf_counter()
+    positions = {}
+    for p, place in enumerate(places):
+        positions.setdefault(place.get('placeId') or place.get('id'), []).append(p)
+
+    place_reviews = {}
+    place_work = {}  # place_id -> (review keys, start, prefix) from the place aggregate
+    verdicts = {}    # review key -> verdict for reviews not covered by an aggregate
+    pending_texts, pending_keys, queued = [], [], set()
+    inference = {"ms": 0.0, "batches": 0, "reviews": 0, "cache_hits": 0, "reviews_reused": 0}
+
+    def classify_pending(flush):
+        size = len(pending_texts) if flush else (len(pending_texts) // batch_size) * batch_size
+        if not size:
+            return
+        started = time.perf_counter()
+        with trace.span('inference'):
+            if classify_batcher.enabled:
+                # One merged submission, whatever the forward passes it ends up sharing
+                results, batches = classify_batcher.submit(pending_texts[:size]), 1
+            else:
+                results, batches = classify_reviews(pending_texts[:size], batch_size)
+        fresh = dict(zip(pending_keys[:size], results))
+        del pending_texts[:size], pending_keys[:size]
+        inference["ms"] += (time.perf_counter() - started) * 1000
+        inference["batches"] += batches
+        inference["reviews"] += size
+        verdicts.update(fresh)
+        verdict_cache.put_many(fresh, trace)
+
+    for found in iter_place_reviews(list(positions), trace):
+        lookups = {}
+        for place_id, reviews in found.items():
+            place_reviews[place_id] = reviews
+            if len(reviews) < MIN_REVIEW_COUNT:
+                continue
+            keys = [verdict_cache.review_key(r) for r in reviews]
+            start, prefix = verdict_cache.place_prefix(place_id, keys)
+            place_work[place_id] = (keys, start, prefix)
+            inference["reviews_reused"] += start
+            for key, review in zip(keys[start:], reviews[start:]):
+                text = review_input(review)
+                if text is not None and key not in verdicts and key not in queued:
+                    lookups[key] = text
+
+        hits = verdict_cache.get_many(list(lookups), trace)
+        verdicts.update(hits)
+        inference["cache_hits"] += len(hits)
+        for key, text in lookups.items():
+            if key not in hits:
+                queued.add(key)
+                pending_texts.append(text)
+                pending_keys.append(key)
+        classify_pending(flush=False)
+    classify_pending(flush=True)
+    fetch_and_inference_ms = (time.perf_counter() - stage_start) * 1000
+
+    # 3. Per-place bad-ratio decision, extending each place's aggregate with its new reviews
+    stage_start = time.perf_counter()
+    bad_counts = {}
+    for place_id, (keys, start, prefix) in place_work.items():
+        reviews = place_reviews[place_id]
+        new_flags = [
+            is_review_bad(place_id, review, verdicts.get(key), trace)
+            for key, review in zip(keys[start:], reviews[start:])
+        ]
+        if start:
+            trace.append(f"Place {place_id}: reused {start} previously judged reviews")
+        bad_counts[place_id] = verdict_cache.put_place(place_id, keys, prefix, new_flags)
+
     filtered_places = []
     for place in places:
-        # Pass the list append method as the logger
-        if is_place_acceptable(place, log_buffer):
+        place_id = place.get('placeId') or place.get('id')
+        if is_place_acceptable(place, len(place_reviews.get(place_id, [])), bad_counts.get(place_id, 0), trace):
             filtered_places.append(place)
+    decision_ms = (time.perf_counter() - stage_start) * 1000
+
+    timing = {
+        "fetch_and_inference_ms": round(fetch_and_inference_ms, 2),
+        "inference_ms": round(inference["ms"], 2),
+        "io_wait_ms": round(fetch_and_inference_ms - inference["ms"], 2),
+        "decision_ms": round(decision_ms, 2),
+        "reviews_classified": inference["reviews"],
+        "batches": inference["batches"],
+        "cache_hits": inference["cache_hits"],
+        "reviews_reused": inference["reviews_reused"],
+        "batch_size": batch_size,
+    }
+    dlog(f"Timing: {timing}")
             
     dlog(f"Returning {len(filtered_places)} places after filtering (Original: {len(places)})")
     dlog("===== END: FILTER PLACES SENTIMENT =====")
     
-    # Print all logs at once
-    print("\n".join(log_buffer))
+    # One structured log entry per request
+    trace.emit(200, timing=timing)
     
-    return (jsonify({"places": filtered_places}), 200, headers)
+    return (jsonify({"places": filtered_places, "timing": timing}), 200, headers)
@@ -0,0 +1,101 @@
+import os
+import queue
+import threading
+import time
+
+from instrumentation import count
+
+# --- MICRO-BATCHING ---
+# Same file in both inference services; benchmarks/run_benchmarks.py checks the copies match.
+#
+# With several requests in flight in one worker (gunicorn gthread), each would
+# run its own small forward pass. The batcher instead queues their items, waits
+# up to `window_ms` for more to arrive (or until `max_batch` items are queued),
+# runs ONE call of `fn` on everything and hands each request its own slice.
+# window_ms = 0 disables it: submit() calls fn directly on the caller's thread.
+
+
+class _Job:
+    __slots__ = ('items', 'results', 'error', 'batch_size', 'done')
+
+    def __init__(self, items):
+        self.items = items
+        self.results = None
+        self.error = None
+        self.batch_size = 0
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    def __init__(self, fn, max_batch, window_ms, name='batcher'):
+        """fn(items) -> results, one result per item in the same order."""
+        self.fn = fn
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self.name = name
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+
+    @property
+    def enabled(self):
+        return self.window > 0
+
+    def _ensure_worker(self):
+        # Threads do not survive fork, so each (gunicorn) worker process starts its own
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._queue = queue.Queue()
+                threading.Thread(target=self._run, name=self.name, daemon=True).start()
+
+    def submit(self, items):
+        """Blocks until the batch holding `items` has run; returns their results."""
+        items = list(items)
+        if not items:
+            return []
+        if not self.enabled:
+            return self.fn(items)
+
+        self._ensure_worker()
+        job = _Job(items)
+        self._queue.put(job)
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        count('microbatch_size', job.batch_size)
+        return job.results
+
+    def _run(self):
+        pending = self._queue
+        while True:
+            jobs = [pending.get()]
+            size = len(jobs[0].items)
+            deadline = time.monotonic() + self.window
+            while size < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    job = pending.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                jobs.append(job)
+                size += len(job.items)
+
+            merged = [item for job in jobs for item in job.items]
+            try:
+                results = self.fn(merged)
+                start = 0
+                for job in jobs:
+                    job.results = results[start:start + len(job.items)]
+                    job.batch_size = len(merged)
+                    start += len(job.items)
+            except BaseException as e:
+                # Whatever fn raises goes to the callers: this thread must outlive it,
+                # or every later submit() in the process would wait forever
+                for job in jobs:
+                    job.error = e
+            finally:
+                for job in jobs:
+                    job.done.set()
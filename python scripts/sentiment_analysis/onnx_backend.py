@@ -0,0 +1,128 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+from onnx_common import (
+    BACKENDS, benchmark, create_session, default_onnx_dir, export_quantized, length_sorted_batches,
+    load_tokenizer, run_cli, tokenize,
+)
+
+# --- INFERENCE BACKENDS ---
+# 'torch' : transformers sentiment-analysis pipeline, fp32 (original behaviour)
+# 'onnx'  : exported classifier run by onnxruntime on CPU, int8 dynamic
+#           quantization, tokenized with the Rust `tokenizers` package. Neither
+#           torch nor transformers is imported in this mode.
+# Session, tokenizer, export and the command line are shared with the NLP
+# service through onnx_common.py.
+
+MAX_SEQ_LENGTH = 512
+
+# Quantized model must agree with PyTorch on at least this share of labels,
+# and its scores may drift by at most MAX_SCORE_DIFF
+MIN_LABEL_AGREEMENT = 0.95
+MAX_SCORE_DIFF = 0.05
+
+
+class OnnxTextClassifier:
+    """
+    Drop-in for the transformers pipeline call the service uses:
+    classifier(text or [texts]) -> [{"label", "score"}, ...] (softmax of the top class).
+    """
+
+    def __init__(self, onnx_dir, quantized=True, threads=None):
+        self.session, self.input_names = create_session(onnx_dir, quantized, threads)
+
+        with open(os.path.join(onnx_dir, 'config.json')) as f:
+            id2label = json.load(f)['id2label']
+        self.labels = [id2label[str(i)] for i in range(len(id2label))]
+
+        self.tokenizer = load_tokenizer(onnx_dir, MAX_SEQ_LENGTH)
+
+    def _classify_batch(self, texts):
+        logits = self.session.run(None, tokenize(self.tokenizer, texts, self.input_names))[0]
+        logits = logits - logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+        best = probs.argmax(axis=1)
+        return [{"label": self.labels[b], "score": float(p[b])} for b, p in zip(best, probs)]
+
+    def __call__(self, inputs, batch_size=32, **kwargs):
+        texts = [inputs] if isinstance(inputs, str) else list(inputs)
+        results = [None] * len(texts)
+        for idx in length_sorted_batches(texts, batch_size):
+            for i, result in zip(idx, self._classify_batch([texts[i] for i in idx])):
+                results[i] = result
+        return results
+
+
+def load_classifier(backend, model_name, onnx_dir=None):
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {list(BACKENDS)}")
+    if backend == 'onnx':
+        return OnnxTextClassifier(onnx_dir or default_onnx_dir(model_name))
+
+    from transformers import pipeline
+    return pipeline("sentiment-analysis", model=model_name)
+
+
+# --- EXPORT / VALIDATION / BENCHMARK (build time, needs torch) ---
+def export(model_name, onnx_dir):
+    """Exports the classifier to ONNX, then writes an int8 dynamically quantized copy."""
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    export_quantized(
+        model, tokenizer, onnx_dir, "a sample review", ('input_ids', 'attention_mask'), 'logits', {0: 'batch'}
+    )
+    # id2label for OnnxTextClassifier
+    model.config.save_pretrained(onnx_dir)
+
+
+def validate(model_name, onnx_dir, texts):
+    """Compares ONNX int8 labels/scores against the PyTorch pipeline."""
+    reference = load_classifier('torch', model_name)
+    candidate = OnnxTextClassifier(onnx_dir)
+
+    ref = reference(texts, truncation=True, max_length=MAX_SEQ_LENGTH)
+    got = candidate(texts)
+    agreement = float(np.mean([r['label'] == g['label'] for r, g in zip(ref, got)]))
+    # Compare P(label of the reference) so a flipped label shows up as a large diff
+    diffs = [abs(r['score'] - (g['score'] if r['label'] == g['label'] else 1 - g['score'])) for r, g in zip(ref, got)]
+
+    report = {
+        "texts": len(texts),
+        "label_agreement": agreement,
+        "max_score_diff": float(max(diffs)),
+        "tolerance": {"label_agreement": MIN_LABEL_AGREEMENT, "score_diff": MAX_SCORE_DIFF},
+    }
+    report["ok"] = agreement >= MIN_LABEL_AGREEMENT and report["max_score_diff"] <= MAX_SCORE_DIFF
+    return report
+
+
+def bench_one(backend, model_name, onnx_dir, texts):
+    return benchmark(
+        backend, lambda: load_classifier(backend, model_name, onnx_dir),
+        lambda classifier, batch, batch_size: classifier(batch, batch_size=batch_size),
+        texts, batch_size=32,
+    )
+
+
+if __name__ == '__main__':
+    sample_texts = [
+        "Rating: 5/5. Amazing food and friendly staff, will come back!",
+        "Rating: 1/5. Dirty tables and we waited an hour for cold soup.",
+        "Rating: 3/5. It was ok, nothing special.",
+        "Rating: 4/5. Lovely garden, a bit crowded on weekends.",
+        "Rating: 2/5. Overpriced tickets and half the exhibits were closed.",
+        "Rating: 5/5. Best coffee in town.",
+        "Rating: 1/5. Rude security guard.",
+        "Rating: 4/5. " + "Great views from the top and a nice walk along the river. " * 20,
+    ]
+    sys.exit(run_cli(
+        __file__, "Export, validate and benchmark the ONNX sentiment backend",
+        os.environ.get('SENTIMENT_MODEL_NAME', 'distilbert-base-uncased-finetuned-sst-2-english'),
+        export, validate, bench_one, sample_texts,
+    ))
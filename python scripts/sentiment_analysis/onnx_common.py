@@ -0,0 +1,169 @@
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# --- ONNX BACKEND PLUMBING ---
+# Same file in both inference services; benchmarks/run_benchmarks.py checks the copies match.
+#
+# What the services' onnx_backend.py share: where the exported model lives, the
+# onnxruntime session and Rust tokenizer setup, the torch -> ONNX -> int8 export,
+# and the export / validate / bench command line. Each onnx_backend.py keeps
+# only what is specific to its model (pooling vs. softmax, reference pipeline,
+# tolerances, sample texts).
+BACKENDS = ('torch', 'onnx')
+
+MODEL_FILE = 'model.onnx'
+QUANTIZED_MODEL_FILE = 'model.int8.onnx'
+
+
+def default_onnx_dir(model_name):
+    here = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(here, 'artifacts', f"onnx-{model_name.replace('/', '__')}")
+
+
+def create_session(onnx_dir, quantized=True, threads=None):
+    """(onnxruntime CPU session, names of its inputs)."""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+    model_file = QUANTIZED_MODEL_FILE if quantized else MODEL_FILE
+    session = ort.InferenceSession(os.path.join(onnx_dir, model_file), options, providers=['CPUExecutionProvider'])
+    return session, {i.name for i in session.get_inputs()}
+
+
+def load_tokenizer(onnx_dir, max_length):
+    """The exported tokenizer.json, truncating to max_length and padding each batch."""
+    from tokenizers import Tokenizer
+
+    tokenizer = Tokenizer.from_file(os.path.join(onnx_dir, 'tokenizer.json'))
+    tokenizer.enable_truncation(max_length=max_length)
+    tokenizer.enable_padding()
+    return tokenizer
+
+
+def tokenize(tokenizer, texts, input_names):
+    """Feeds for session.run: int64 arrays for the inputs the model takes."""
+    encodings = tokenizer.encode_batch(texts)
+    feeds = {
+        'input_ids': np.array([e.ids for e in encodings], dtype=np.int64),
+        'attention_mask': np.array([e.attention_mask for e in encodings], dtype=np.int64),
+    }
+    if 'token_type_ids' in input_names:
+        feeds['token_type_ids'] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+    return {k: v for k, v in feeds.items() if k in input_names}
+
+
+def length_sorted_batches(texts, batch_size):
+    """Index lists of at most batch_size texts; length-sorted batches waste less compute on padding."""
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+# --- EXPORT / BENCHMARK / CLI (build time, needs torch) ---
+def export_quantized(model, tokenizer, onnx_dir, sample_text, input_names, output_name, output_axes):
+    """
+    Exports the torch model (called with keyword inputs, read back through
+    `output_name`) to ONNX, then writes an int8 dynamically quantized copy.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    os.makedirs(onnx_dir, exist_ok=True)
+    tokenizer.save_pretrained(onnx_dir)
+
+    sample = tokenizer([sample_text], return_tensors='pt')
+    input_names = [n for n in input_names if n in sample]
+    dynamic_axes = {n: {0: 'batch', 1: 'sequence'} for n in input_names}
+    dynamic_axes[output_name] = output_axes
+
+    class Wrapper(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, *inputs):
+            return getattr(self.inner(**dict(zip(input_names, inputs))), output_name)
+
+    model_path = os.path.join(onnx_dir, MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            Wrapper(model.eval()), tuple(sample[n] for n in input_names), model_path,
+            input_names=input_names, output_names=[output_name],
+            dynamic_axes=dynamic_axes, opset_version=14,
+        )
+    quantize_dynamic(model_path, os.path.join(onnx_dir, QUANTIZED_MODEL_FILE), weight_type=QuantType.QInt8)
+
+
+def benchmark(backend, load, infer, texts, batch_size, repeats=3):
+    """
+    Startup time, peak RSS and per-item latency for one backend (run in a fresh
+    process). load() -> model; infer(model, texts, batch_size) runs it.
+    """
+    import resource
+
+    started = time.perf_counter()
+    model = load()
+    startup_s = time.perf_counter() - started
+
+    infer(model, texts[:1], 1)  # warm-up
+    single = []
+    for text in texts:
+        t = time.perf_counter()
+        infer(model, [text], 1)
+        single.append(time.perf_counter() - t)
+    batched = []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        infer(model, texts, batch_size)
+        batched.append((time.perf_counter() - t) / len(texts))
+
+    return {
+        "backend": backend,
+        "startup_s": round(startup_s, 3),
+        # ru_maxrss is KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "single_ms_p50": round(float(np.median(single)) * 1000, 3),
+        "batched_ms_per_item": round(min(batched) * 1000, 3),
+    }
+
+
+def run_cli(script, description, default_model, export, validate, bench_one, texts):
+    """
+    export / validate / bench / bench-one commands of an onnx_backend.py (`script`):
+    export(model_name, onnx_dir); validate(model_name, onnx_dir, texts) -> report
+    with "ok"; bench_one(backend, model_name, onnx_dir, texts) -> benchmark() result.
+    """
+    import argparse
+    import subprocess
+
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('command', choices=('export', 'validate', 'bench', 'bench-one'))
+    parser.add_argument('--model', default=default_model)
+    parser.add_argument('--onnx-dir', default=None)
+    parser.add_argument('--backend', choices=BACKENDS, default='onnx')
+    args = parser.parse_args()
+    onnx_dir = args.onnx_dir or default_onnx_dir(args.model)
+
+    if args.command == 'export':
+        export(args.model, onnx_dir)
+        print(f"Exported {args.model} to {onnx_dir}")
+    elif args.command == 'validate':
+        result = validate(args.model, onnx_dir, texts)
+        print(json.dumps(result, indent=2))
+        return 0 if result["ok"] else 1
+    elif args.command == 'bench-one':
+        print(json.dumps(bench_one(args.backend, args.model, onnx_dir, texts)))
+    else:
+        # One fresh interpreter per backend so startup and RSS are not shared
+        for backend in BACKENDS:
+            out = subprocess.run(
+                [sys.executable, script, 'bench-one', '--backend', backend, '--model', args.model, '--onnx-dir', onnx_dir],
+                capture_output=True, text=True, check=True,
+            )
+            print(out.stdout.strip().splitlines()[-1])
+    return 0
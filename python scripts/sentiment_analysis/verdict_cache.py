@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# --- REVIEW VERDICT CACHE ---
+# A verdict is keyed by sha256(model version, rating, text), so an edited review
+# or a model/backend change misses automatically. Lookups go local LRU ->
+# optional persistent store (a Firestore collection shared by all instances);
+# only the misses reach the model.
+#
+# Per place we also keep the review keys already aggregated and a running count
+# of bad reviews, so when a place's `ratings` array only grew, just the new
+# reviews are looked at.
+
+VERDICT_CACHE_SIZE = int(os.environ.get('SENTIMENT_VERDICT_CACHE_SIZE', 50000))
+PLACE_CACHE_SIZE = int(os.environ.get('SENTIMENT_PLACE_CACHE_SIZE', 5000))
+
+# Firestore limits: documents per get_all we send, writes per batch
+STORE_READ_CHUNK = 100
+STORE_WRITE_CHUNK = 500
+
+
+class LRUCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class FirestoreVerdictStore:
+    """Verdicts as documents {label, score, model} in one collection, id = review key."""
+
+    def __init__(self, client, collection):
+        self.client = client
+        self.collection = collection
+
+    def get_many(self, keys):
+        found = {}
+        for start in range(0, len(keys), STORE_READ_CHUNK):
+            refs = [self.client.collection(self.collection).document(k) for k in keys[start:start + STORE_READ_CHUNK]]
+            for snapshot in self.client.get_all(refs):
+                if snapshot.exists:
+                    found[snapshot.id] = snapshot.to_dict()
+        return found
+
+    def put_many(self, verdicts):
+        items = list(verdicts.items())
+        for start in range(0, len(items), STORE_WRITE_CHUNK):
+            batch = self.client.batch()
+            for key, verdict in items[start:start + STORE_WRITE_CHUNK]:
+                batch.set(self.client.collection(self.collection).document(key), verdict)
+            batch.commit()
+
+
+class VerdictCache:
+    def __init__(self, model_version, store=None,
+                 verdict_cache_size=VERDICT_CACHE_SIZE, place_cache_size=PLACE_CACHE_SIZE):
+        self.model_version = model_version
+        self.store = store
+        self._verdicts = LRUCache(verdict_cache_size)
+        # place_id -> (review keys, cumulative bad counts with len(keys) + 1 entries)
+        self._places = LRUCache(place_cache_size)
+
+    def review_key(self, review):
+        payload = json.dumps([self.model_version, review.get('rating', 0), review.get('review', '')])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    # --- per-review verdicts ---
+    def get_many(self, keys, logger):
+        """{key: {"label", "score"}} for the keys already classified by this model version."""
+        found, misses = {}, []
+        for key in keys:
+            verdict = self._verdicts.get(key)
+            if verdict is not None:
+                found[key] = verdict
+            else:
+                misses.append(key)
+
+        if misses and self.store is not None:
+            try:
+                stored = self.store.get_many(misses)
+            except Exception as e:
+                # The store only saves work; a failed read just means more inference
+                logger.append(f"Verdict store read failed: {e}")
+                stored = {}
+            for key, doc in stored.items():
+                if doc.get('model') == self.model_version:
+                    verdict = {"label": doc['label'], "score": doc['score']}
+                    self._verdicts.put(key, verdict)
+                    found[key] = verdict
+        return found
+
+    def put_many(self, verdicts, logger):
+        for key, verdict in verdicts.items():
+            self._verdicts.put(key, {"label": verdict['label'], "score": float(verdict['score'])})
+
+        if verdicts and self.store is not None:
+            try:
+                self.store.put_many({
+                    key: {"label": v['label'], "score": float(v['score']), "model": self.model_version}
+                    for key, v in verdicts.items()
+                })
+            except Exception as e:
+                logger.append(f"Verdict store write failed: {e}")
+
+    # --- per-place aggregates ---
+    def place_prefix(self, place_id, keys):
+        """
+        (start, prefix) where reviews[:start] are unchanged since the last request
+        for this place and prefix[i] counts the bad ones among reviews[:i]
+        (so prefix[-1] of them are bad). Only reviews[start:] need work.
+        """
+        entry = self._places.get(place_id)
+        if entry is None:
+            return 0, [0]
+        cached_keys, cumulative = entry
+        start = 0
+        for cached, key in zip(cached_keys, keys):
+            if cached != key:
+                break
+            start += 1
+        return start, cumulative[:start + 1]
+
+    def put_place(self, place_id, keys, prefix, new_flags):
+        """Stores the aggregate once reviews[start:] were judged (new_flags[i] = is bad); returns the bad count."""
+        cumulative = list(prefix)
+        for is_bad in new_flags:
+            cumulative.append(cumulative[-1] + int(is_bad))
+        self._places.put(place_id, (tuple(keys), cumulative))
+        return cumulative[-1]
@@ -213,24 +213,33 @@ export const createRouteWithKeywords = functions.https.onCall(
 
       dlog(`Processing ${keywordsToProcess.length} keywords...`);
 
-      for (const keyword of keywordsToProcess) {
-        try {
-          dlog(`Calling microservice for keyword: ${keyword}`);
-          const response = await axios.post(
-            "https://match-keywords-634529947719.europe-southwest1.run.app",
-            { keywords: [keyword] },
-            { headers: { "Content-Type": "application/json" } }
-          );
+      // The service rejects an empty batch ({queries: []} is a 400), and nothing could match anyway
+      if (keywordsToProcess.length === 0) {
+        dlog("No keywords to process. Returning empty list.");
+        return { places: [] };
+      }
+
+      // One batched request: the service embeds all keywords in a single forward pass
+      try {
+        dlog("Calling microservice for keywords: " + JSON.stringify(keywordsToProcess));
+        const response = await axios.post(
+          "https://match-keywords-634529947719.europe-southwest1.run.app",
+          { queries: keywordsToProcess },
+          { headers: { "Content-Type": "application/json" } }
+        );
 
-          if (response.data && response.data.category) {
-            dlog(`Match found: ${response.data.category}`);
-            matchedCategories.push(response.data.category);
+        const results = (response.data && response.data.results) || [];
+        results.forEach((result: any, i: number) => {
+          const category = result?.matches?.[0]?.category;
+          if (category) {
+            dlog(`Match found for '${keywordsToProcess[i]}': ${category}`);
+            matchedCategories.push(category);
           } else {
-            dlog(`No match for: ${keyword}`);
+            dlog(`No match for: ${keywordsToProcess[i]}`);
           }
-        } catch (err: any) {
-          dlog(`Error matching keyword '${keyword}': ${err.message}`);
-        }
+        });
+      } catch (err: any) {
+        dlog(`Error matching keywords: ${err.message}`);
       }
 
       // Remove duplicates